@@ -2,10 +2,17 @@
 import streamlit as st
 import numpy as np
 import pandas as pd
-import plotly.graph_objects as go
 import time
+import os
+import uuid
+from backend import RenderBackend
+from cache import SimulationCache
+from trajstore import open_trajectories
+from metrics import BURN_IN, REGIMES, RunningStats, classify_regime
+from profiling import StageProfiler
 from simulation import run_simulation
-from metrics import eliteCaptureIndex
+from service import ServiceClient
+from figures import get_compass_fig, get_gauge_fig, load_figure
 
 # --- PAGE CONFIG ---
 st.set_page_config(page_title="Oligarchy Simulator", layout="wide", initial_sidebar_state="expanded")
@@ -22,118 +29,66 @@ if 'sim_data' not in st.session_state:
     st.session_state['sim_data'] = None
 if 'current_frame' not in st.session_state:
     st.session_state['current_frame'] = 0
+if 'anim_fig' not in st.session_state:
+    st.session_state['anim_fig'] = None
+if 'profile' not in st.session_state:
+    st.session_state['profile'] = None
+if 'session_id' not in st.session_state:
+    st.session_state['session_id'] = uuid.uuid4().hex
+if 'render' not in st.session_state:
+    st.session_state['render'] = None
 
-# --- HELPER: POLITICAL COMPASS FIGURE ---
-def get_compass_fig(public_pos, policy_pos, elite_list, current_weights=None):
-    fig = go.Figure()
-
-    # 1. Background Quadrants
-    fig.add_shape(type="rect", x0=0, y0=0, x1=1.5, y1=1.5, 
-        fillcolor="rgba(50, 100, 255, 0.1)", layer="below", line_width=0)
-    fig.add_shape(type="rect", x0=-1.5, y0=0, x1=0, y1=1.5, 
-        fillcolor="rgba(255, 50, 50, 0.1)", layer="below", line_width=0)
-    fig.add_shape(type="rect", x0=-1.5, y0=-1.5, x1=0, y1=0, 
-        fillcolor="rgba(50, 200, 50, 0.1)", layer="below", line_width=0)
-    fig.add_shape(type="rect", x0=0, y0=-1.5, x1=1.5, y1=0, 
-        fillcolor="rgba(255, 200, 0, 0.1)", layer="below", line_width=0)
-
-    # 2. Elite Centroid
-    if elite_list:
-        e_x = [e['x'] for e in elite_list]
-        e_y = [e['y'] for e in elite_list]
-        w = current_weights if current_weights is not None else [e['weight'] for e in elite_list]
-        
-        if sum(w) > 0:
-            c_x = np.average(e_x, weights=w)
-            c_y = np.average(e_y, weights=w)
-            fig.add_trace(go.Scatter(
-                x=[c_x], y=[c_y], mode='markers', name='Elite Consensus',
-                marker=dict(size=22, color='purple', symbol='star', line=dict(width=2, color='white')),
-                hoverinfo='name'
-            ))
-
-    # 3. Elites
-    if elite_list:
-        e_names = [e['name'] for e in elite_list]
-        e_x = [e['x'] for e in elite_list]
-        e_y = [e['y'] for e in elite_list]
-        
-        if current_weights is not None:
-            sizes = [15 + (wt * 20) for wt in current_weights]
-            hover_txt = [f"{n}<br>Power: {wt:.2f}" for n, wt in zip(e_names, current_weights)]
-        else:
-            sizes = [15 + (e['weight'] * 20) for e in elite_list]
-            hover_txt = [f"{e['name']}<br>Init Power: {e['weight']:.2f}" for e in elite_list]
-
-        fig.add_trace(go.Scatter(
-            x=e_x, y=e_y, mode='markers+text', name='Individual Elites',
-            marker=dict(size=sizes, color='black', symbol='diamond', line=dict(width=1, color='white')),
-            text=e_names, textposition="top center",
-            hovertext=hover_txt, hoverinfo="text"
-        ))
-
-    # 4. Public
-    fig.add_trace(go.Scatter(
-        x=[public_pos[0]], y=[public_pos[1]], mode='markers', name='Public Opinion',
-        marker=dict(size=22, color='blue', symbol='circle', line=dict(width=2, color='white'))
-    ))
-
-    # 5. Policy
-    fig.add_trace(go.Scatter(
-        x=[policy_pos[0]], y=[policy_pos[1]], mode='markers', name='Policy Outcome',
-        marker=dict(size=20, color='green', symbol='x', line=dict(width=4, color='white'))
-    ))
-
-    fig.update_layout(
-        xaxis=dict(range=[-1.5, 1.5], title="Economic (Left ↔ Right)", zeroline=True, fixedrange=True, showgrid=False),
-        yaxis=dict(range=[-1.5, 1.5], title="Social (Lib ↔ Auth)", zeroline=True, fixedrange=True, showgrid=False),
-        height=550, margin=dict(l=20, r=20, t=30, b=20),
-        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
-        plot_bgcolor="white", uirevision='constant'
-    )
-    return fig
-
-def get_gauge_fig(value, title, color, frame_idx=0):
-    # Micro-adjustment to prevent duplicate ID error on static frames
-    unique_val = value + (frame_idx * 1e-9)
-    
-    fig = go.Figure(go.Indicator(
-        mode = "gauge+number",
-        value = unique_val,
-        title = {'text': title, 'font': {'size': 20, 'color': 'black'}},
-        number = {'font': {'size': 30}},
-        gauge = {
-            'axis': {'range': [None, 1], 'tickwidth': 1},
-            'bar': {'color': color},
-            'bgcolor': "white",
-            'borderwidth': 1,
-            'bordercolor': "gray",
-            'steps': [{'range': [0, 1], 'color': 'rgba(240, 242, 246, 0.5)'}]
-        }
-    ))
-    fig.update_layout(height=180, margin=dict(l=30, r=30, t=50, b=10)) 
-    return fig
+# --- SHARED RESULT CACHE (one per server process, used by every session) ---
+@st.cache_resource
+def get_simulation_cache():
+    return SimulationCache(max_entries=256, max_bytes=256 * 2**20)
+
+# --- OPTIONAL SIMULATION SERVICE ("host:port" of a running `python service.py`) ---
+SERVICE_ADDRESS = os.environ.get("OLIGARCHY_SERVICE")
+
+# --- WORKER PROCESSES (simulation and figure serialization, shared by every session) ---
+@st.cache_resource
+def get_render_backend():
+    return RenderBackend()
+
+def get_render_job():
+    # Figures for this session's trajectory, rendered on the worker pool
+    job = st.session_state['render']
+    if job is None or job.cancelled or job.data is not st.session_state['sim_data']:
+        job = get_render_backend().render(st.session_state['session_id'], st.session_state['sim_data'], st.session_state['elite_list'])
+        st.session_state['render'] = job
+    return job
+
+def cancel_session_work():
+    # Drop this session's queued simulation and render tasks
+    get_render_backend().cancel(st.session_state['session_id'])
+    st.session_state['render'] = None
+
+# Delay between live-playback frames, in seconds
+FRAME_SECONDS = 0.08
+
+# --- SAVED TRAJECTORY FILES (memory-mapped, opened once per file version) ---
+@st.cache_resource
+def open_trajectory_file(path, mtime):
+    return open_trajectories(path)
+
+# Card styling per regime, in metrics.REGIMES order
+REGIME_COLORS = ("#28a745", "#17a2b8", "#fd7e14", "#dc3545")  # Green, Teal, Orange, Red
+REGIME_DESCRIPTIONS = (
+    "The government effectively translates public preference into policy.",
+    "The public has influence, but elite pressure regularly skews outcomes.",
+    "Democratic institutions exist but predominantly serve elite interests.",
+    "The state apparatus has been completely co-opted by the ruling class.",
+)
 
 def get_result_card(avg_theta, avg_eci):
     """
     Verdict based strictly on Democratic Responsiveness.
     """
-    if avg_theta >= 0.70:
-        verdict = "HEALTHY DEMOCRACY"
-        color = "#28a745" # Green
-        desc = "The government effectively translates public preference into policy."
-    elif avg_theta >= 0.50:
-        verdict = "FLAWED DEMOCRACY"
-        color = "#17a2b8" # Teal
-        desc = "The public has influence, but elite pressure regularly skews outcomes."
-    elif avg_theta >= 0.30:
-        verdict = "OLIGARCHIC CAPTURE"
-        color = "#fd7e14" # Orange
-        desc = "Democratic institutions exist but predominantly serve elite interests."
-    else:
-        verdict = "TOTAL OLIGARCHY"
-        color = "#dc3545" # Red
-        desc = "The state apparatus has been completely co-opted by the ruling class."
+    regime = classify_regime(avg_theta)
+    verdict = REGIMES[regime]
+    color = REGIME_COLORS[regime]
+    desc = REGIME_DESCRIPTIONS[regime]
 
     return f"""
     <div style="
@@ -177,7 +132,12 @@ with st.sidebar:
     help_eta = "How quickly the public accepts the new status quo (policy) as their own preference.\n\nINCREASES WITH: Propaganda, Media Monopolies.\nDECREASES WITH: Critical Thinking, Independent Journalism."
     help_kappa = "How much more power elites get when they 'win'.\n\nINCREASES WITH: Wealth Inequality, Unregulated Markets.\nDECREASES WITH: Progressive Taxes, Antitrust Laws."
 
+    help_seed = "Fixes the random shocks, so the same settings always replay the same history."
+    help_playback = "In browser: the whole run is sent once and animated by your browser.\n\nLive from server: each cycle is drawn and streamed by the server."
+
     noise_scale = st.slider("Noise", 0.0, 0.2, 0.1, step=0.01, help=help_noise)
+    seed = st.number_input("Random Seed", 0, 2**31 - 1, 0, step=1, help=help_seed)
+    playback = st.radio("Playback", ["In browser", "Live from server"], help=help_playback)
     
     st.divider()
     st.subheader("System Parameters")
@@ -193,6 +153,33 @@ with st.sidebar:
     eta = st.slider("Public Learning Rate", 0.0, 1.0, 0.05, help=help_eta)
     kappa = st.slider("Elite Power Sensitivity", 0.0, 5.0, 1.0, help=help_kappa)
 
+    st.divider()
+    with st.expander("Saved Runs"):
+        traj_path = st.text_input("Trajectory File", help="Path of a file written by trajstore (e.g. write_ensemble).")
+        traj_run = st.number_input("Run Index", 0, step=1)
+        load_run = st.button("Load Run", use_container_width=True)
+
+    with st.expander("Debug"):
+        profile_stages = st.checkbox("Profile Simulation Stages", help="Time each stage of the cycle loop. Profiled runs bypass the result cache.")
+        profile_allocs = st.checkbox("Count Allocations", help="Also record, per stage, the net allocated blocks and bytes and the peak bytes, with tracemalloc (slower).")
+
+# Replay one run of a saved ensemble; only that run's pages are read from disk
+if load_run:
+    try:
+        saved = open_trajectory_file(traj_path, os.path.getmtime(traj_path))
+        if traj_run >= len(saved):
+            raise IndexError(f"the file holds {len(saved)} runs")
+    except (OSError, ValueError, IndexError) as err:
+        st.sidebar.error(f"Could not load run: {err}")
+    else:
+        cancel_session_work()
+        st.session_state['elite_list'] = saved.eliteList()
+        st.session_state['sim_data'] = saved.run(int(traj_run))
+        st.session_state['anim_fig'] = None
+        st.session_state['profile'] = None
+        st.session_state['sim_state'] = 'PLAYING'
+        st.session_state['current_frame'] = 0
+
 
 # --- MAIN APP LOGIC ---
 st.title("Oligarchy Simulator")
@@ -239,11 +226,38 @@ if st.session_state['sim_state'] == 'SETUP':
             st.markdown("---")
             if st.button("START SIMULATION", type="primary", use_container_width=True):
                 M_0 = np.array([m0_x, m0_y])
-                results = run_simulation(
-                    T, M_0, theta_0, st.session_state['elite_list'], 
-                    eta, kappa, lambd, noise_scale, alpha, theta_star
-                )
+                cancel_session_work()
+                if profile_stages:
+                    profiler = StageProfiler(trace_allocations=profile_allocs)
+                    results = run_simulation(
+                        T, M_0, theta_0, st.session_state['elite_list'], 
+                        eta, kappa, lambd, noise_scale, alpha, theta_star, rng=int(seed), profiler=profiler
+                    )
+                    st.session_state['profile'] = profiler.report()
+                else:
+                    results = None
+                    if SERVICE_ADDRESS:
+                        # Shared compute pool; segments stream back while the run progresses
+                        progress = st.progress(0.0, text="Queued on the simulation service...")
+                        try:
+                            results = ServiceClient.fromAddress(SERVICE_ADDRESS).run(
+                                dict(T=T, M_0=M_0, theta_0=theta_0, elite_data=st.session_state['elite_list'],
+                                     eta=eta, kappa=kappa, lambd=lambd, noise_scale=noise_scale,
+                                     alpha=alpha, theta_star=theta_star, seed=int(seed)),
+                                on_progress=lambda done, total: progress.progress(done / total, text=f"Simulating... {done} / {total} cycles")
+                            )
+                        except (OSError, RuntimeError) as err:
+                            st.warning(f"Simulation service unavailable ({err}); running locally.")
+                    if results is None:
+                        results = get_render_backend().simulate(
+                            st.session_state['session_id'], T, M_0, theta_0, st.session_state['elite_list'], 
+                            eta, kappa, lambd, noise_scale, alpha, theta_star, seed=int(seed), cache=get_simulation_cache()
+                        ).result()
+                    st.session_state['profile'] = None
                 st.session_state['sim_data'] = results
+                st.session_state['anim_fig'] = None
+                # Start serializing figures while the page reruns
+                get_render_job().prefetch(animation=playback == "In browser")
                 st.session_state['sim_state'] = 'PLAYING'
                 st.session_state['current_frame'] = 0
                 st.rerun()
@@ -279,6 +293,10 @@ else:
             btn_play = c_play.button("▶️ Run")
             btn_reset = c_reset.button("↺ Reset")
 
+            if st.session_state['profile']:
+                with st.expander("Debug: Stage Profile"):
+                    st.dataframe(pd.DataFrame(st.session_state['profile']).set_index('stage'), use_container_width=True)
+
         with col_chart:
             # Chart Legend / Help Tooltips
             # We use st.caption to provide the requested legend help
@@ -292,35 +310,49 @@ else:
 
         # Handle Reset
         if btn_reset:
+            cancel_session_work()
             st.session_state['sim_state'] = 'SETUP'
             st.session_state['current_frame'] = 0
+            st.session_state['anim_fig'] = None
             st.rerun()
 
         # Handle Animation
+        # In-browser playback ships the whole run once, so go straight to the finished view
+        if playback == "In browser" and (st.session_state['sim_state'] == 'PLAYING' or btn_play):
+            st.session_state['sim_state'] = 'FINISHED'
+
         if st.session_state['sim_state'] == 'PLAYING' or btn_play:
             st.session_state['sim_state'] = 'PLAYING'
             data = st.session_state['sim_data']
+            start = st.session_state['current_frame']
+
+            # Running averages from cycle BURN_IN onwards, seeded with any frames already played
+            theta_stats = RunningStats()
+            eci_stats = RunningStats()
+            theta_stats.extend(data.theta[BURN_IN:start])
+            eci_stats.extend(data.eci[BURN_IN:start])
             
-            for i in range(st.session_state['current_frame'], len(data)):
+            # Figures arrive pre-serialized from the worker pool; this loop only streams them
+            for i, (compass_json, theta_json, eci_json) in get_render_job().frames(start):
+                tick = time.perf_counter()
                 frame = data[i]
                 
                 # Metrics
-                eci = eliteCaptureIndex(frame.M, frame.E, frame.O)
                 cycle_slot.metric("Cycle", f"{frame.t} / {len(data)}")
                 
-                theta_slot.plotly_chart(get_gauge_fig(frame.theta, "Democracy Score", "blue", i), use_container_width=True, config={'displayModeBar': False})
-                eci_slot.plotly_chart(get_gauge_fig(eci, "Elite Capture", "red", i), use_container_width=True, config={'displayModeBar': False})
+                theta_slot.plotly_chart(load_figure(theta_json), use_container_width=True, config={'displayModeBar': False})
+                eci_slot.plotly_chart(load_figure(eci_json), use_container_width=True, config={'displayModeBar': False})
                 
-                if i > 5:
-                    sub = data[5:i+1]
-                    avg_t = np.mean([x.theta for x in sub])
-                    avg_e = np.mean([eliteCaptureIndex(x.M, x.E, x.O) for x in sub])
-                    theta_avg_slot.caption(f"Avg: {avg_t:.2f}")
-                    eci_avg_slot.caption(f"Avg: {avg_e:.2f}")
+                if i >= BURN_IN:
+                    theta_stats.push(frame.theta)
+                    eci_stats.push(frame.eci)
+                if i > BURN_IN:
+                    theta_avg_slot.caption(f"Avg: {theta_stats.mean:.2f}")
+                    eci_avg_slot.caption(f"Avg: {eci_stats.mean:.2f}")
 
-                chart_slot.plotly_chart(get_compass_fig(frame.M, frame.O, st.session_state['elite_list'], frame.w), use_container_width=True, config={'displayModeBar': False})
+                chart_slot.plotly_chart(load_figure(compass_json), use_container_width=True, config={'displayModeBar': False})
 
-                time.sleep(0.08)
+                time.sleep(max(0.0, FRAME_SECONDS - (time.perf_counter() - tick)))
                 st.session_state['current_frame'] = i
             
             st.session_state['sim_state'] = 'FINISHED'
@@ -330,17 +362,23 @@ else:
         if st.session_state['sim_state'] == 'FINISHED':
             data = st.session_state['sim_data']
             last = data[-1]
-            valid = data[5:] if len(data) > 5 else data
+            valid = data[BURN_IN:] if len(data) > BURN_IN else data
             
-            final_t = np.mean([x.theta for x in valid])
-            final_e = np.mean([eliteCaptureIndex(x.M, x.E, x.O) for x in valid])
+            final_t = np.mean(valid.theta)
+            final_e = np.mean(valid.eci)
             
             result_slot.markdown(get_result_card(final_t, final_e), unsafe_allow_html=True)
             
             cycle_slot.metric("Cycle", "Finished")
             theta_slot.plotly_chart(get_gauge_fig(last.theta, "Democracy Score", "blue", 999), use_container_width=True, config={'displayModeBar': False})
-            eci_slot.plotly_chart(get_gauge_fig(eliteCaptureIndex(last.M, last.E, last.O), "Elite Capture", "red", 999), use_container_width=True, config={'displayModeBar': False})
+            eci_slot.plotly_chart(get_gauge_fig(last.eci, "Elite Capture", "red", 999), use_container_width=True, config={'displayModeBar': False})
             theta_avg_slot.caption(f"Final Avg: {final_t:.2f}")
             eci_avg_slot.caption(f"Final Avg: {final_e:.2f}")
             
-            chart_slot.plotly_chart(get_compass_fig(last.M, last.O, st.session_state['elite_list'], last.w), use_container_width=True, config={'displayModeBar': False})
\ No newline at end of file
+            if playback == "In browser":
+                # Built once per simulation and kept for reruns of this session
+                if st.session_state['anim_fig'] is None:
+                    st.session_state['anim_fig'] = load_figure(get_render_job().animation())
+                chart_slot.plotly_chart(st.session_state['anim_fig'], use_container_width=True, config={'displayModeBar': False})
+            else:
+                chart_slot.plotly_chart(get_compass_fig(last.M, last.O, st.session_state['elite_list'], last.w), use_container_width=True, config={'displayModeBar': False})
\ No newline at end of file
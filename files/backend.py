@@ -0,0 +1,209 @@
+# backend.py
+"""
+Process-pool backend for the app: simulations and figure serialization run in worker
+processes, so concurrent sessions do not serialize on the script threads' shared GIL.
+Imports no Streamlit; workers load only the model and figures.py.
+"""
+import multiprocessing
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+
+from figures import figure_json, frame_payloads, get_compass_animation
+from simulation import run_simulation
+
+# Frames serialized per pool task
+CHUNK = 10
+
+# Chunks a live playback keeps in flight ahead of the frame on screen
+LOOKAHEAD = 3
+
+# Sessions unused for this many seconds are dropped, as are the least recently used beyond MAX_SESSIONS
+SESSION_IDLE = 30 * 60
+MAX_SESSIONS = 64
+
+
+def _simulate(args, seed):
+    # Worker: one run_simulation call
+    return run_simulation(*args, rng=seed)
+
+
+def _render_animation(data, elite_list):
+    # Worker: the in-browser playback figure, serialized
+    return figure_json(get_compass_animation(data, elite_list))
+
+
+def _warm():
+    # Worker: nothing; submitting it starts a process and loads the imports above
+    return None
+
+
+class RenderJob:
+    def __init__(self, pool, data, elite_list, chunk=CHUNK, lookahead=LOOKAHEAD):
+        """
+        Figures of one finished trajectory, serialized on the pool on demand.
+
+        Live frames are rendered in chunks, at most `lookahead` chunks ahead of the reader, so
+        several sessions share the pool chunk by chunk; a chunk is released once frames() has
+        read it, so only the in-browser figure stays held. cancel() drops every pending task.
+        """
+        self.data = data
+        self.elite_list = [dict(e) for e in elite_list]
+        self.chunk = chunk
+        self.lookahead = lookahead
+        self.cancelled = False
+        self.lastUsed = time.monotonic()
+        self._pool = pool
+        self._chunks = {}
+        self._animation = None
+        self._lock = threading.Lock()
+
+    def _submitChunks(self, first, count):
+        with self._lock:
+            if self.cancelled:
+                raise CancelledError()
+            self.lastUsed = time.monotonic()
+            for start in range(first, min(first + count * self.chunk, len(self.data)), self.chunk):
+                if start not in self._chunks:
+                    # Only the chunk's rows go to the worker, not the whole trajectory
+                    frames = self.data[start:start + self.chunk]
+                    self._chunks[start] = self._pool.submit(frame_payloads, frames, self.elite_list, start)
+
+    def _submitAnimation(self):
+        with self._lock:
+            if self.cancelled:
+                raise CancelledError()
+            self.lastUsed = time.monotonic()
+            if self._animation is None:
+                self._animation = self._pool.submit(_render_animation, self.data, self.elite_list)
+
+    def prefetch(self, start=0, animation=False):
+        # Queue the in-browser figure, or the first live chunks from frame start, without waiting
+        if animation:
+            self._submitAnimation()
+        else:
+            self._submitChunks(start - start % self.chunk, self.lookahead)
+
+    def frames(self, start=0):
+        """
+        Yield (i, (compass, democracy gauge, capture gauge) JSON) for frames start.. in order,
+        as their chunks finish.
+
+        :raises CancelledError: once the job is cancelled
+        """
+        for first in range(start - start % self.chunk, len(self.data), self.chunk):
+            self._submitChunks(first, self.lookahead)
+            with self._lock:
+                payloads = self._chunks.pop(first).result
+            for i, payload in enumerate(payloads(), start=first):
+                if i >= start:
+                    yield i, payload
+
+    def animation(self):
+        """
+        JSON of the in-browser playback figure (see figures.get_compass_animation); blocks until built.
+        """
+        self._submitAnimation()
+        return self._animation.result()
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            for future in self._chunks.values():
+                future.cancel()
+            if self._animation is not None:
+                self._animation.cancel()
+
+
+class RenderBackend:
+    def __init__(self, workers=None, chunk=CHUNK, lookahead=LOOKAHEAD, idle=SESSION_IDLE, max_sessions=MAX_SESSIONS):
+        """
+        Shared worker pool for every app session (one per server process).
+
+        Workers are spawned rather than forked, since the server process runs threads.
+        Sessions that never call cancel() are dropped after idle seconds without use, and the
+        least recently used go first once more than max_sessions are open.
+
+        :param workers: process count (None lets the executor decide)
+        """
+        self.chunk = chunk
+        self.lookahead = lookahead
+        self.idle = idle
+        self.max_sessions = max_sessions
+        self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        self._sessions = {}
+        self._touched = {}
+        self._lock = threading.Lock()
+        self._pool.submit(_warm)
+
+    def _track(self, session, job):
+        # Finished simulations need no handle; render jobs stay until cancelled or evicted
+        with self._lock:
+            jobs = self._sessions.setdefault(session, [])
+            jobs[:] = [j for j in jobs if not (isinstance(j, Future) and j.done())]
+            jobs.append(job)
+            self._touched[session] = time.monotonic()
+            evicted = self._evict()
+        for old in evicted:
+            old.cancel()
+        return job
+
+    def _lastUsed(self, session):
+        renders = [j.lastUsed for j in self._sessions[session] if isinstance(j, RenderJob)]
+        return max([self._touched[session]] + renders)
+
+    def _evict(self):
+        # Unlink idle sessions and the least recently used beyond max_sessions; caller holds the lock
+        now = time.monotonic()
+        by_age = sorted(self._sessions, key=self._lastUsed)
+        stale = [s for s in by_age if now - self._lastUsed(s) > self.idle]
+        excess = by_age[:max(len(by_age) - self.max_sessions, 0)]
+        evicted = []
+        for session in set(stale) | set(excess):
+            evicted += self._sessions.pop(session)
+            del self._touched[session]
+        return evicted
+
+    def simulate(self, session, T, M_0, theta_0, elite_data, eta, kappa, lambd, noise_scale, alpha, theta_star,
+                 seed=None, cache=None):
+        """
+        run_simulation on the pool, through a SimulationCache when one is given.
+
+        :return: Future of the Trajectory; cancel(session) cancels it while still queued
+        """
+        args = (T, M_0, theta_0, [dict(e) for e in elite_data], eta, kappa, lambd, noise_scale, alpha, theta_star)
+        key = None
+        if cache is not None:
+            key, trajectory = cache.lookup(*args, seed)
+            if trajectory is not None:
+                future = Future()
+                future.set_result(trajectory)
+                return future
+
+        future = self._pool.submit(_simulate, args, seed)
+        if key is not None:
+            def store(done):
+                if not done.cancelled() and done.exception() is None:
+                    cache.put(key, done.result())
+            future.add_done_callback(store)
+        return self._track(session, future)
+
+    def render(self, session, data, elite_list):
+        """
+        RenderJob for a finished trajectory, owned by session.
+        """
+        return self._track(session, RenderJob(self._pool, data, elite_list, self.chunk, self.lookahead))
+
+    def cancel(self, session):
+        """
+        Cancel everything session still has queued; tasks already running finish and are discarded.
+        """
+        with self._lock:
+            jobs = self._sessions.pop(session, [])
+            self._touched.pop(session, None)
+        for job in jobs:
+            job.cancel()
+        return len(jobs)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,278 @@
+# basins.py
+import hashlib
+import json
+import re
+
+import numpy as np
+
+from elites import BatchWorkspace, Elites, centroidBatch, updateWeightsBatch
+from metrics import BURN_IN, REGIMES, classify_regime
+from scenario import elites_digest
+
+# Runs advanced together per batch
+CHUNK = 8192
+
+# Default lattice step, in pixels, of the first (coarsest) level of a map
+COARSE = 16
+
+# Initial conditions a map axis can vary
+AXIS_PATTERN = re.compile(r"^(theta_0|M_0\[(\d+)\])$")
+
+
+def average_theta(M_0, theta_0, elite_data, T, eta, kappa, lambd, alpha, theta_star, burn_in=BURN_IN):
+    """
+    Noise-free batched runs reduced to their average theta, without storing trajectories.
+
+    Follows the same stages as ensemble.run_ensemble with zero noise, keeping only the running
+    sum of theta after burn_in, so memory is O(N K) however long the runs are.
+
+    :param M_0: initial public preferences, shape (N, d)
+    :param theta_0: initial responsiveness, scalar or shape (N,)
+    :return: (N,) mean of theta over cycles burn_in..T-1 (all cycles when T <= burn_in)
+    """
+    M = np.array(M_0, dtype=float)
+    N, d = M.shape
+    elites = Elites(elite_data, d=d)
+    positions = elites.positions
+    weights = np.broadcast_to(elites.weights.astype(float), (N, len(elites.weights))).copy()
+    theta = np.broadcast_to(np.asarray(theta_0, dtype=float), (N,)).copy()
+
+    burn_in = burn_in if T > burn_in else 0
+    total = np.zeros(N)
+    workspace = BatchWorkspace(N, positions)
+    E = np.empty((N, d))
+    for t in range(T):
+        # 1. Compute Elite Centroid
+        centroidBatch(weights, positions, out=E, workspace=workspace)
+
+        # 2. Update Policy
+        O = E + theta[:, None] * (M - E)
+
+        # 3. Compute Metrics
+        eci = np.linalg.norm(O - M, axis=1) / (np.linalg.norm(E - M, axis=1) + 0.0001)
+
+        # 4. Update Public Preference
+        M += eta * (O - M)
+
+        # 5. Update Elite Weights
+        updateWeightsBatch(weights, positions, O, kappa, workspace=workspace)
+
+        # 6. Update Responsiveness
+        theta = np.clip(theta + alpha * (theta_star - theta) - lambd * eci, 0.0, 1.0)
+
+        # 7. Accumulate
+        if t >= burn_in:
+            total += theta
+
+    return total / (T - burn_in)
+
+
+class BasinMapper:
+    def __init__(self, elite_data, T, eta, kappa, lambd, alpha, theta_star, M_0=(0.0, 0.0), theta_0=1.0,
+                 axes=('M_0[0]', 'M_0[1]'), burn_in=BURN_IN, chunk=CHUNK):
+        """
+        Regime maps over initial conditions for one fixed elite configuration and parameter set.
+
+        Each point of a map is a noise-free run started from (M_0, theta_0) with the two axis
+        coordinates replaced, classified by metrics.classify_regime on its average theta.
+        Every classified point is kept in a cache keyed by its coordinates, so the coarse
+        lattice of one map (and any point shared with an earlier map) is never simulated twice.
+
+        :param M_0, theta_0: initial conditions for the coordinates the axes do not vary
+        :param axes: (x axis, y axis), each 'theta_0' or 'M_0[i]'
+        :param chunk: runs simulated per batch
+        """
+        self.elite_data = elite_data
+        self.params = {'T': int(T), 'eta': eta, 'kappa': kappa, 'lambd': lambd, 'alpha': alpha,
+                       'theta_star': theta_star}
+        self.M_0 = np.array(M_0, dtype=float)
+        self.theta_0 = float(theta_0)
+        self.axes = tuple(axes)
+        self.burn_in = burn_in
+        self.chunk = chunk
+
+        if len(self.axes) != 2 or self.axes[0] == self.axes[1]:
+            raise ValueError("need two different axes")
+        for axis in self.axes:
+            match = AXIS_PATTERN.match(axis)
+            if match is None:
+                raise ValueError(f"Unknown axis {axis!r}; use 'theta_0' or 'M_0[i]'")
+            if match.group(2) is not None and int(match.group(2)) >= len(self.M_0):
+                raise ValueError(f"axis {axis!r} is out of range for M_0 of dimension {len(self.M_0)}")
+
+        self.simulated = 0
+        self._cache = {}
+
+    @property
+    def key(self):
+        """
+        sha256 of everything a point's regime depends on besides its coordinates.
+        """
+        payload = {
+            'elites': elites_digest(self.elite_data),
+            'params': {name: float(value) for name, value in self.params.items()},
+            'M_0': self.M_0.tolist(),
+            'theta_0': self.theta_0,
+            'axes': self.axes,
+            'burn_in': self.burn_in,
+        }
+        blob = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    def classify(self, x, y):
+        """
+        Regime index of each point (x[i], y[i]), from the cache where possible.
+
+        :return: int8 array of indices into metrics.REGIMES
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        keys = list(zip(np.round(x, 12).tolist(), np.round(y, 12).tolist()))
+        regimes = np.fromiter((self._cache.get(k, -1) for k in keys), dtype=np.int8, count=len(keys))
+
+        missing = np.flatnonzero(regimes < 0)
+        if len(missing):
+            regimes[missing] = self._simulate(x[missing], y[missing])
+            self._cache.update(zip((keys[i] for i in missing), regimes[missing].tolist()))
+        return regimes
+
+    def _simulate(self, x, y):
+        M_0 = np.broadcast_to(self.M_0, (len(x), len(self.M_0))).copy()
+        theta_0 = np.full(len(x), self.theta_0)
+        for axis, values in zip(self.axes, (x, y)):
+            index = AXIS_PATTERN.match(axis).group(2)
+            if index is None:
+                theta_0[:] = values
+            else:
+                M_0[:, int(index)] = values
+
+        p = self.params
+        regimes = np.empty(len(x), dtype=np.int8)
+        for start in range(0, len(x), self.chunk):
+            stop = start + self.chunk
+            avg = average_theta(M_0[start:stop], theta_0[start:stop], self.elite_data, p['T'], p['eta'], p['kappa'],
+                                p['lambd'], p['alpha'], p['theta_star'], self.burn_in)
+            regimes[start:stop] = classify_regime(avg)
+        self.simulated += len(x)
+        return regimes
+
+    def map(self, x_range, y_range, resolution, coarse=COARSE):
+        """
+        Regime image over a rectangle of initial conditions, refined only near boundaries.
+
+        Pixels sit on a resolution[0] x resolution[1] lattice including the rectangle's edges.
+        The corners of a coarse grid of cells (coarse pixels apart) are classified first; a cell
+        whose four corners agree is filled with their regime, any other is split into four and
+        its new corners classified, down to single pixels. Each level is one batch of runs.
+
+        A region of another regime that fits inside one coarse cell without touching its corners
+        is missed; lower `coarse` (1 classifies every pixel) for maps with fine structure.
+
+        :param x_range, y_range: (low, high) of the x and y axes
+        :param resolution: pixels per side, an int or (nx, ny), each at least 2
+        :param coarse: first-level cell size in pixels (rounded down to a power of two)
+        :return: BasinMap
+        """
+        nx, ny = (resolution, resolution) if np.isscalar(resolution) else resolution
+        if nx < 2 or ny < 2:
+            raise ValueError("resolution must be at least 2 pixels per side")
+        xs = np.linspace(x_range[0], x_range[1], nx)
+        ys = np.linspace(y_range[0], y_range[1], ny)
+        labels = np.full((ny, nx), -1, dtype=np.int8)
+
+        step = 1 << (max(int(coarse), 1).bit_length() - 1)
+        I, J = (a.ravel() for a in np.meshgrid(np.arange(0, ny - 1, step), np.arange(0, nx - 1, step), indexing='ij'))
+        uniform_cells = []
+        simulated = self.simulated
+
+        while len(I):
+            # Classify the corners of this level's cells (each cell spans [I, I1] x [J, J1])
+            I1 = np.minimum(I + step, ny - 1)
+            J1 = np.minimum(J + step, nx - 1)
+            rows = np.concatenate([I, I, I1, I1])
+            cols = np.concatenate([J, J1, J, J1])
+            self._label(labels, rows, cols, xs, ys)
+
+            corners = labels[rows, cols].reshape(4, -1)
+            uniform = np.all(corners == corners[0], axis=0)
+            uniform_cells.append((I[uniform], I1[uniform], J[uniform], J1[uniform], corners[0, uniform]))
+            if step == 1:
+                break
+
+            # Split the others into four, dropping children that start on the last row or column
+            half = step // 2
+            I, J = I[~uniform], J[~uniform]
+            I = np.concatenate([I, I + half, I, I + half])
+            J = np.concatenate([J, J, J + half, J + half])
+            keep = (I < ny - 1) & (J < nx - 1)
+            I, J = I[keep], J[keep]
+            step = half
+
+        # Fill uniform cells last, so no classified pixel is overwritten
+        for I0, I1, J0, J1, regime in uniform_cells:
+            for i0, i1, j0, j1, r in zip(I0.tolist(), I1.tolist(), J0.tolist(), J1.tolist(), regime.tolist()):
+                block = labels[i0:i1 + 1, j0:j1 + 1]
+                block[block < 0] = r
+
+        return BasinMap(labels, xs, ys, self.axes, self.simulated - simulated)
+
+    def _label(self, labels, rows, cols, xs, ys):
+        # Classify the not yet labelled pixels among (rows, cols)
+        todo = labels[rows, cols] < 0
+        flat = np.unique(rows[todo] * labels.shape[1] + cols[todo])
+        r, c = np.divmod(flat, labels.shape[1])
+        labels[r, c] = self.classify(xs[c], ys[r])
+
+    def saveCache(self, path):
+        """
+        Write the point cache to an .npz file, tagged with this mapper's key.
+        """
+        points = np.array(list(self._cache), dtype=float).reshape(-1, 2)
+        regimes = np.fromiter(self._cache.values(), dtype=np.int8, count=len(self._cache))
+        np.savez_compressed(path, key=self.key, points=points, regimes=regimes)
+
+    def loadCache(self, path):
+        """
+        Merge a cache written by saveCache; files from a different configuration are ignored.
+
+        :return: number of points loaded
+        """
+        with np.load(path) as data:
+            if str(data['key']) != self.key:
+                return 0
+            self._cache.update(zip(map(tuple, data['points'].tolist()), data['regimes'].tolist()))
+            return len(data['regimes'])
+
+
+class BasinMap:
+    def __init__(self, labels, xs, ys, axes, simulated):
+        """
+        Result of BasinMapper.map.
+
+        :param labels: (ny, nx) int8 regime indices; row i is ys[i], column j is xs[j]
+        :param simulated: runs simulated for this map (the rest came from the cache or filling)
+        """
+        self.labels = labels
+        self.xs = xs
+        self.ys = ys
+        self.axes = axes
+        self.simulated = simulated
+
+    def fractions(self):
+        # Share of the map in each regime, by name
+        counts = np.bincount(self.labels.ravel(), minlength=len(REGIMES))
+        return {name: count / self.labels.size for name, count in zip(REGIMES, counts.tolist())}
+
+    def save(self, path):
+        np.savez_compressed(path, labels=self.labels, xs=self.xs, ys=self.ys, axes=np.array(self.axes),
+                            regimes=np.array(REGIMES))
+
+
+def _parse_range(spec):
+    # "M_0[0]=-2:2" -> ('M_0[0]', (-2.0, 2.0))
+    try:
+        name, bounds = spec.split("=", 1)
+        low, high = bounds.split(":")
+        return name, (float(low), float(high))
+    except ValueError:
+        raise ValueError(f"Bad axis range {spec!r}; expected AXIS=LO:HI, e.g. M_0[0]=-2:2") from None
@@ -0,0 +1,387 @@
+# benchmarks.py
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from elites import Elites
+from dynamics import Dynamics
+from ensemble import run_ensemble
+from fastpath import run_deterministic
+from metrics import eliteCaptureIndex
+from profiling import snapshot_diff
+from scenario import compile_elites
+from simulation import run_simulation
+from spatial import build_index
+
+# Axis values per suite. Each axis is swept on its own, the others held at BASE.
+SUITES = {
+    'quick': {
+        'T': [100, 1000, 10**4],
+        'K': [1, 10, 100, 1000],
+        'd': [2, 8, 64],
+        'N': [1, 100, 10**3],
+    },
+    'full': {
+        'T': [100, 1000, 10**4, 10**5, 10**6],
+        'K': [1, 10, 100, 1000, 10**4],
+        'd': [2, 8, 16, 32, 64],
+        'N': [1, 10, 100, 10**3, 10**4, 10**5],
+    },
+}
+BASE = {'T': 1000, 'K': 10, 'd': 2, 'N': 1}
+
+# Ensemble cases use short runs so that N = 10^5 stays within memory
+ENSEMBLE_T = 20
+# Calls per timing of the single-kernel cases
+KERNEL_CALLS = 1000
+PARAMS = {'eta': 0.05, 'kappa': 1.0, 'lambd': 0.05, 'noise_scale': 0.05, 'alpha': 0.1, 'theta_star': 0.8}
+
+# Sparse cases: K elites in SPARSE_CLUSTERS tight clusters spread over a box of half-width
+# SPARSE_BOX, so nearly every elite leaves the active set in the first cycles. Each case is run
+# with and without a grid index built once over all positions (as when one index is shared
+# across runs); the two give the same weights.
+SPARSE = {'T': 20, 'K': 10**5, 'd': 2}
+SPARSE_CLUSTERS = 200
+SPARSE_BOX = 500.0
+SPARSE_EPSILON = 1e-12
+
+
+def _legacy_step(elites, dynamics, M, theta, params, noise):
+    # One cycle as run_simulation did it before the in-place kernels: every stage allocates
+    E = np.average(elites.positions, axis=0, weights=elites.weights)
+    O = theta * np.array(M) + (1 - theta) * np.array(E)
+    eci = (np.linalg.norm(np.array(O) - np.array(M))
+           / (np.linalg.norm(np.array(E) - np.array(M)) + 0.0001))
+    M = np.array(M) + params['eta'] * (np.array(O) - np.array(M)) + np.array(noise)
+    distances = np.linalg.norm(elites.positions - np.array(O), axis=1)
+    unnormalized = np.array(elites.weights) * np.exp(-params['kappa'] * distances)
+    elites.weights = unnormalized / np.sum(unnormalized)
+    theta = np.clip(theta + params['alpha'] * (params['theta_star'] - theta) - params['lambd'] * eci, 0.0, 1.0)
+    return M, theta
+
+
+def _inplace_step(elites, dynamics, M, theta, params, noise, buffers):
+    # One cycle with every kernel writing into preallocated buffers
+    E_buf, O_buf, M_next, workspace = buffers
+    E = elites.computeEliteCentroid(out=E_buf)
+    O = dynamics.updatePolicy(E, M, theta, out=O_buf)
+    eci = eliteCaptureIndex(M, E, O, workspace=workspace)
+    dynamics.updatePublicPreference(M, O, params['eta'], noise, out=M_next)
+    # Swap the two public-preference buffers
+    buffers[2] = M
+    M = M_next
+    elites.updateWeights(elites.weights, elites.positions, O, params['kappa'])
+    theta = dynamics.updateTheta(eci, params['lambd'], params['alpha'], params['theta_star'])
+    return M, theta
+
+
+def bench_step(K=1000, d=10, steps=2000, seed=0):
+    """
+    Microbenchmark of a single simulation cycle, legacy (allocating) versus in-place kernels.
+
+    :return: dict {mode: {'us_per_step': float, 'allocations_per_step': int, 'peak_bytes_per_step': int}};
+             allocations_per_step counts the memory blocks one step allocates and leaves live
+             (tracemalloc snapshot counts), and peak_bytes_per_step is its transient high-water
+             mark, which also covers the temporaries it frees
+    """
+    rng = np.random.default_rng(seed)
+    positions = rng.normal(size=(K, d))
+    params = {'eta': 0.05, 'kappa': 1.0, 'lambd': 0.05, 'alpha': 0.1, 'theta_star': 0.8}
+    noise = np.zeros(d)
+
+    results = {}
+    for mode in ('legacy', 'inplace'):
+        elites = Elites.fromArrays(positions, np.full(K, 1.0 / K))
+        dynamics = Dynamics(policy=np.zeros(d), publicPreference=np.zeros(d), theta=0.7)
+        M = np.zeros(d)
+        theta = 0.7
+        buffers = [np.empty(d), np.empty(d), np.empty(d), np.empty(d)]
+
+        def step(M, theta):
+            if mode == 'legacy':
+                return _legacy_step(elites, dynamics, M, theta, params, noise)
+            return _inplace_step(elites, dynamics, M, theta, params, noise, buffers)
+
+        # Warm up, then time
+        M, theta = step(M, theta)
+        start = time.perf_counter()
+        for _ in range(steps):
+            M, theta = step(M, theta)
+        elapsed = time.perf_counter() - start
+
+        # Transient memory high-water mark of one step, above what is already live
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        M, theta = step(M, theta)
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+
+        # Blocks the next step leaves allocated; holding its inputs keeps the arrays it
+        # replaces from cancelling out the ones it allocates
+        inputs = (M, elites.weights)
+        before = tracemalloc.take_snapshot()
+        M, theta = step(M, theta)
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        del inputs
+
+        results[mode] = {'us_per_step': elapsed / steps * 1e6,
+                         'allocations_per_step': snapshot_diff(before, after)[0],
+                         'peak_bytes_per_step': peak}
+    return results
+
+
+def _elite_data(K, d, seed=0):
+    rng = np.random.default_rng(seed)
+    return [{'name': f"Elite {i}", 'position': p, 'weight': 1.0 / K} for i, p in enumerate(rng.normal(size=(K, d)))]
+
+
+def _clustered_elites(K, d, seed=0):
+    # Compiled once per case, so the timing excludes parsing K elite dicts
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(-SPARSE_BOX, SPARSE_BOX, size=(SPARSE_CLUSTERS, d))
+    positions = centers[rng.integers(SPARSE_CLUSTERS, size=K)] + rng.normal(scale=0.05, size=(K, d))
+    return compile_elites([{'name': f"Elite {i}", 'position': p, 'weight': 1.0 / K} for i, p in enumerate(positions)])
+
+
+def _simulation_args(p):
+    return (p['T'], np.zeros(p['d']), 0.7, _elite_data(p['K'], p['d']),
+            PARAMS['eta'], PARAMS['kappa'], PARAMS['lambd'], PARAMS['noise_scale'], PARAMS['alpha'], PARAMS['theta_star'])
+
+
+def _make_case(name, p):
+    """
+    :return: (callable running the case once, number of cycles or calls it performs)
+    """
+    if name == 'run_simulation':
+        args = _simulation_args(p)
+        return (lambda: run_simulation(*args, rng=0)), p['T']
+
+    if name == 'run_deterministic':
+        T, M_0, theta_0, elite_data = _simulation_args(p)[:4]
+        return (lambda: run_deterministic(T, M_0, theta_0, elite_data, PARAMS['eta'], PARAMS['kappa'],
+                                          PARAMS['lambd'], PARAMS['alpha'], PARAMS['theta_star'])), p['T']
+
+    if name in ('run_simulation_sparse', 'run_simulation_sparse_index'):
+        elites = _clustered_elites(p['K'], p['d'])
+        index = build_index(elites.positions, 'grid') if name.endswith('_index') else None
+        args = (p['T'], np.zeros(p['d']), 0.7, elites, PARAMS['eta'], PARAMS['kappa'], PARAMS['lambd'],
+                PARAMS['noise_scale'], PARAMS['alpha'], PARAMS['theta_star'])
+        return (lambda: run_simulation(*args, rng=0, elite_epsilon=SPARSE_EPSILON, elite_index=index)), p['T']
+
+    if name == 'run_ensemble':
+        args = _simulation_args(p)
+        return (lambda: run_ensemble(p['N'], *args, seed=0)), p['N'] * p['T']
+
+    elites = Elites.fromArrays(np.random.default_rng(0).normal(size=(p['K'], p['d'])), np.full(p['K'], 1.0 / p['K']))
+    O = np.full(p['d'], 0.1)
+    M = np.zeros(p['d'])
+    buffers = [np.empty(p['d']) for _ in range(3)]
+
+    if name == 'elites.updateWeights':
+        def fn():
+            for _ in range(KERNEL_CALLS):
+                elites.updateWeights(elites.weights, elites.positions, O, PARAMS['kappa'])
+    elif name == 'elites.computeEliteCentroid':
+        def fn():
+            for _ in range(KERNEL_CALLS):
+                elites.computeEliteCentroid(out=buffers[0])
+    elif name == 'dynamics.step':
+        dynamics = Dynamics(policy=M, publicPreference=M, theta=0.7)
+        E = elites.computeEliteCentroid()
+        def fn():
+            for _ in range(KERNEL_CALLS):
+                dynamics.updatePolicy(E, M, 0.7, out=buffers[0])
+                dynamics.updatePublicPreference(M, buffers[0], PARAMS['eta'], 0.0, out=buffers[1])
+                dynamics.updateTheta(0.2, PARAMS['lambd'], PARAMS['alpha'], PARAMS['theta_star'])
+    elif name == 'metrics.eliteCaptureIndex':
+        E = elites.computeEliteCentroid()
+        def fn():
+            for _ in range(KERNEL_CALLS):
+                eliteCaptureIndex(M, E, O, workspace=buffers[2])
+    else:
+        raise ValueError(f"unknown benchmark {name}")
+    return fn, KERNEL_CALLS
+
+
+def suite_cases(suite):
+    """
+    :return: list of (benchmark name, params) for the given suite, without duplicates
+    """
+    sizes = SUITES[suite]
+    cases = []
+    for T in sizes['T']:
+        cases.append(('run_simulation', dict(BASE, T=T)))
+        cases.append(('run_deterministic', dict(BASE, T=T)))
+    for K in sizes['K']:
+        cases.append(('run_simulation', dict(BASE, K=K)))
+        cases.append(('elites.updateWeights', dict(BASE, K=K)))
+        cases.append(('elites.computeEliteCentroid', dict(BASE, K=K)))
+    for d in sizes['d']:
+        cases.append(('run_simulation', dict(BASE, d=d)))
+        cases.append(('elites.updateWeights', dict(BASE, d=d)))
+        cases.append(('dynamics.step', dict(BASE, d=d)))
+        cases.append(('metrics.eliteCaptureIndex', dict(BASE, d=d)))
+    for N in sizes['N']:
+        cases.append(('run_ensemble', dict(BASE, T=ENSEMBLE_T, N=N)))
+    cases.append(('run_simulation_sparse', dict(SPARSE)))
+    cases.append(('run_simulation_sparse_index', dict(SPARSE)))
+
+    unique = {}
+    for name, p in cases:
+        # Single-kernel cases only depend on K and d
+        if '.' in name:
+            p = {'K': p['K'], 'd': p['d']}
+        unique.setdefault(_case_id(name, p), (name, p))
+    return list(unique.values())
+
+
+def measure(fn, cycles, repeats=3, budget=1.0):
+    """
+    Best-of-repeats wall time, then one extra run under tracemalloc for the peak memory.
+    Repeats stop early once budget seconds have been spent.
+
+    One untimed call comes first, so one-off costs (Numba compilation in run_deterministic,
+    first-touch allocations, import-time caches) stay out of both measurements.
+    """
+    fn()
+
+    best = float('inf')
+    spent = 0.0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        spent += elapsed
+        if spent > budget:
+            break
+
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'seconds': best,
+        'per_step_us': best / cycles * 1e6,
+        'cycles_per_s': cycles / best,
+        'peak_bytes': peak,
+    }
+
+
+def run_suite(suite='quick', only=None, repeats=3, log=print):
+    """
+    Run every case of a suite.
+
+    :param only: optional substring; keeps only cases whose name contains it
+    :return: JSON-ready dict with 'meta' (environment) and 'results' (one record per case)
+    """
+    results = []
+    for name, p in suite_cases(suite):
+        if only and only not in name:
+            continue
+        fn, cycles = _make_case(name, p)
+        record = dict(name=name, params=p, **measure(fn, cycles, repeats))
+        results.append(record)
+        if log:
+            log(_format_record(record))
+    return {'meta': _environment(suite), 'results': results}
+
+
+def compare(old, new, threshold=1.10):
+    """
+    Match records of two result files by name and params.
+
+    :return: list of (case id, old us/step, new us/step, ratio, regressed?)
+    """
+    before = {_case_id(r['name'], r['params']): r for r in old['results']}
+    rows = []
+    for r in new['results']:
+        key = _case_id(r['name'], r['params'])
+        if key in before:
+            ratio = r['per_step_us'] / before[key]['per_step_us']
+            rows.append((key, before[key]['per_step_us'], r['per_step_us'], ratio, ratio > threshold))
+    return rows
+
+
+def _case_id(name, p):
+    return name + " " + " ".join(f"{k}={v}" for k, v in sorted(p.items()))
+
+
+def _format_record(r):
+    return (f"{_case_id(r['name'], r['params']):<48} {r['per_step_us']:12.3f} us/step "
+            f"{r['cycles_per_s']:14.0f} cycles/s {r['peak_bytes'] / 2**20:10.2f} MiB peak")
+
+
+def _environment(suite):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'suite': suite,
+        'commit': commit,
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulation benchmarks.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run a benchmark suite")
+    run.add_argument("--suite", choices=sorted(SUITES), default="quick")
+    run.add_argument("--only", default=None, help="only cases whose name contains this")
+    run.add_argument("--repeats", type=int, default=3)
+    run.add_argument("--out", default=None, help="write results as JSON to this file")
+
+    cmp = commands.add_parser("compare", help="compare two result files")
+    cmp.add_argument("old")
+    cmp.add_argument("new")
+    cmp.add_argument("--threshold", type=float, default=1.10, help="slowdown ratio counted as a regression")
+
+    step = commands.add_parser("step", help="legacy vs in-place single-cycle microbenchmark")
+    step.add_argument("--K", type=int, default=1000, help="number of elites")
+    step.add_argument("--d", type=int, default=10, help="policy dimension")
+    step.add_argument("--steps", type=int, default=2000)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        report = run_suite(args.suite, args.only, args.repeats)
+        if args.out:
+            with open(args.out, 'w') as f:
+                json.dump(report, f, indent=1)
+            print(f"wrote {len(report['results'])} results to {args.out}")
+
+    elif args.command == "compare":
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        rows = compare(old, new, args.threshold)
+        for key, before, after, ratio, regressed in rows:
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{key:<48} {before:12.3f} -> {after:12.3f} us/step  x{ratio:5.2f}{flag}")
+        if any(row[-1] for row in rows):
+            sys.exit(1)
+
+    else:
+        results = bench_step(args.K, args.d, args.steps)
+        for mode, r in results.items():
+            print(f"{mode:>8}: {r['us_per_step']:8.2f} us/step  {r['allocations_per_step']:>5} allocations/step  "
+                  f"{r['peak_bytes_per_step']:>9} peak bytes/step")
+
+
+if __name__ == "__main__":
+    main()
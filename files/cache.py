@@ -0,0 +1,109 @@
+# cache.py
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from scenario import elites_digest
+from simulation import run_simulation
+
+# Bump when the model changes, so stale entries can never be served
+MODEL_VERSION = 1
+
+
+def simulation_key(T, M_0, theta_0, elite_data, eta, kappa, lambd, noise_scale, alpha, theta_star, seed):
+    """
+    Content address of one run_simulation call: sha256 of its canonical JSON form.
+
+    Elites are keyed by name, position and weight in the given order (scenario.elites_digest,
+    precomputed for an EliteSet); seed must be an int (or None for a noise-free run) so that
+    the key fully determines the result.
+    """
+    payload = {
+        'version': MODEL_VERSION,
+        'T': int(T),
+        'M_0': [float(m) for m in M_0],
+        'theta_0': float(theta_0),
+        'elites': elites_digest(elite_data),
+        'params': [float(p) for p in (eta, kappa, lambd, noise_scale, alpha, theta_star)],
+        'seed': seed,
+    }
+    blob = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class SimulationCache:
+    def __init__(self, max_entries=256, max_bytes=256 * 2**20):
+        """
+        Thread-safe LRU cache of finished trajectories, bounded by entry count and total bytes.
+
+        Cached trajectories are made read-only, since every caller gets the same object.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            trajectory = self._entries.get(key)
+            if trajectory is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return trajectory
+
+    def put(self, key, trajectory):
+        size = trajectory.nbytes
+        if size > self.max_bytes:
+            return trajectory
+        trajectory.setReadOnly()
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._entries[key] = trajectory
+            self._bytes += size
+
+            # Evict least recently used entries until both bounds hold
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+        return trajectory
+
+    def lookup(self, T, M_0, theta_0, elite_data, eta, kappa, lambd, noise_scale, alpha, theta_star, seed=None):
+        """
+        Key and cached trajectory of one run_simulation call, for callers that compute misses themselves.
+
+        :return: (key, trajectory or None); key is None for unseeded noisy runs, which are not
+                 reproducible and so bypass the cache
+        """
+        if seed is None and noise_scale != 0:
+            return None, None
+        key = simulation_key(T, M_0, theta_0, elite_data, eta, kappa, lambd, noise_scale, alpha, theta_star, seed)
+        return key, self.get(key)
+
+    def run(self, T, M_0, theta_0, elite_data, eta, kappa, lambd, noise_scale, alpha, theta_star, seed=None):
+        """
+        run_simulation through the cache (see lookup).
+        """
+        args = (T, M_0, theta_0, elite_data, eta, kappa, lambd, noise_scale, alpha, theta_star)
+        key, trajectory = self.lookup(*args, seed)
+        if trajectory is None:
+            # Computed outside the lock; concurrent misses on one key just do the work twice
+            trajectory = run_simulation(*args, rng=seed)
+            if key is not None:
+                trajectory = self.put(key, trajectory)
+        return trajectory
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        return self._bytes
@@ -0,0 +1,342 @@
+# cli.py
+"""
+Headless entry point for batch workers: python -m cli run|batch|sweep|basins|startup.
+
+Imports only the core model modules (never streamlit, pandas or plotly); the ensemble,
+trajectory-file and sweep modules are imported by the commands that use them.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import config
+from metrics import BURN_IN
+from scenario import DEFAULTS, OPTIONS, PARAMS as SCENARIO_PARAMS, Scenario, compile_elites, load_scenarios, normalize_spec
+from simulation import run_simulation
+
+# run_simulation arguments a config may set, besides the elites (scenario settings other than the name)
+PARAMS = SCENARIO_PARAMS + tuple(name for name in OPTIONS if name != 'name')
+
+# Cold-start budget for `python -m cli run --T 1`, in milliseconds
+STARTUP_TARGET_MS = 400
+
+# Modules the CLI must never load
+HEAVY_MODULES = ('streamlit', 'plotly', 'pandas')
+
+
+def parse_elites(spec):
+    """
+    Elite list from any of the accepted config forms (see scenario.compile_elites):
+      - config.py's eliteInfoDict with string keys, {"x,y": weight} or {"(x, y)": weight}
+        (JSON and YAML mappings cannot have list keys)
+      - a list of [[x, y, ...], weight] pairs
+      - the app's list of {'name', 'x', 'y', 'weight'} or {'name', 'position', 'weight'} dicts
+
+    :return: validated scenario.EliteSet (a tuple of elite dicts with compiled arrays)
+    """
+    return compile_elites(spec)
+
+
+def config_from_module(module=config):
+    """
+    Job dict from a config.py-style module (T, M_0, theta_0, eta, ..., eliteInfoDict).
+    """
+    job = {name: getattr(module, name) for name in PARAMS if hasattr(module, name)}
+    if 'M_0' in job:
+        job['M_0'] = [float(m) for m in job['M_0']]
+    job['elites'] = parse_elites(module.eliteInfoDict)
+    return job
+
+
+def load_jobs(path, overrides=None):
+    """
+    Read a JSON or YAML config file (by extension; YAML needs PyYAML).
+
+    A file holds one job, or {"jobs": [...]} with optional shared settings at the top level.
+    Elites are given as "elites" (app form) or "eliteInfoDict" (config.py form). Files are
+    compiled once per version (scenario.load_scenarios), so repeated loads are cheap.
+
+    :param overrides: settings applied on top of every job
+    :return: list of complete job dicts, defaults filled in; unnamed jobs are named after the file
+    """
+    return [job_from_scenario(s) for s in load_scenarios(path, overrides, _job_defaults())]
+
+
+def make_job(spec):
+    """
+    Validate a job spec and fill in defaults; elites default to config.eliteInfoDict.
+    """
+    return job_from_scenario(Scenario.fromSpec(spec, _job_defaults()))
+
+
+def job_from_scenario(scenario):
+    """
+    Job dict of a compiled scenario: its settings, the EliteSet as 'elites' and its stable 'key'.
+    """
+    job = scenario.toDict()
+    job['elites'] = scenario.elites
+    job['key'] = scenario.key
+    return job
+
+
+def run_job(job, rng=None):
+    """
+    One run_simulation call for a job dict; rng defaults to the job's seed.
+    """
+    return run_simulation(
+        job['T'], np.array(job['M_0']), job['theta_0'], job['elites'], job['eta'], job['kappa'], job['lambd'],
+        job['noise_scale'], job['alpha'], job['theta_star'], rng=job['seed'] if rng is None else rng,
+        elite_epsilon=job['elite_epsilon']
+    )
+
+
+def summarize(theta, eci):
+    """
+    Compact record of one run (arrays of shape (T,)) or of replicates averaged together ((N, T)).
+    """
+    theta = np.atleast_2d(theta)
+    eci = np.atleast_2d(eci)
+    burn_in = BURN_IN if theta.shape[1] > BURN_IN else 0
+    return {
+        'final_theta': float(theta[:, -1].mean()),
+        'avg_theta': float(theta[:, burn_in:].mean()),
+        'avg_eci': float(eci[:, burn_in:].mean()),
+    }
+
+
+def write_run(path, trajectory, job, float32=False):
+    """
+    Save one run by extension: .npz (compressed arrays plus the job as JSON),
+    .trj (trajstore file) or .json (summary only).
+    """
+    dtype = np.float32 if float32 else np.float64
+    if path.endswith('.npz'):
+        columns = {name: np.asarray(getattr(trajectory, name), dtype=dtype) for name in ('M', 'E', 'O', 'w', 'theta', 'eci')}
+        np.savez_compressed(path, job=json.dumps(job), **columns)
+    elif path.endswith('.trj'):
+        from trajstore import TrajectoryWriter
+
+        with TrajectoryWriter(path, 1, len(trajectory), trajectory.M.shape[1], trajectory.w.shape[1],
+                              _params(job), job['elites'], np.dtype(dtype).newbyteorder('<')) as writer:
+            writer.appendTrajectory(trajectory)
+    elif path.endswith('.json'):
+        with open(path, 'w') as f:
+            json.dump(dict(summarize(trajectory.theta, trajectory.eci), job=job), f)
+    else:
+        raise ValueError(f"Cannot tell the output format of {path}; use .npz, .trj or .json")
+
+
+def run_batch(jobs, replicates=1, out=None, log=print):
+    """
+    Run every job, each as one ensemble of `replicates` seeded runs, and append a summary
+    line per job to out (JSON lines) or log it.
+    """
+    from ensemble import run_ensemble
+
+    records = []
+    handle = open(out, 'a') if out else None
+    try:
+        for index, job in enumerate(jobs):
+            start = time.perf_counter()
+            if replicates == 1:
+                trajectory = run_job(job)
+                record = summarize(trajectory.theta, trajectory.eci)
+            else:
+                result = run_ensemble(
+                    replicates, job['T'], np.array(job['M_0']), job['theta_0'], job['elites'], job['eta'],
+                    job['kappa'], job['lambd'], job['noise_scale'], job['alpha'], job['theta_star'], seed=job['seed']
+                )
+                record = summarize(result['theta'], result['eci'])
+            record = dict({'index': index, 'name': job['name'], 'key': job['key'], 'replicates': replicates}, **record,
+                          seconds=round(time.perf_counter() - start, 6))
+            records.append(record)
+            if handle:
+                handle.write(json.dumps(record) + "\n")
+                handle.flush()
+            else:
+                log(json.dumps(record))
+    finally:
+        if handle:
+            handle.close()
+    return records
+
+
+def measure_startup(repeats=5, target_ms=STARTUP_TARGET_MS):
+    """
+    Cold start of `python -m cli run --T 1` in fresh interpreters, plus a check that no
+    heavy UI module was imported.
+
+    :return: dict with the median and best wall time in ms, the target and whether it was met
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    command = [sys.executable, "-m", "cli", "run", "--T", "1", "--check-imports"]
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=here, check=True, stdout=subprocess.DEVNULL)
+        times.append((time.perf_counter() - start) * 1e3)
+    median = float(np.median(times))
+    return {'median_ms': median, 'best_ms': min(times), 'target_ms': target_ms, 'ok': median <= target_ms}
+
+
+def _job_defaults():
+    return dict(DEFAULTS)
+
+
+def _params(job):
+    return {name: job[name] for name in PARAMS}
+
+
+def _parse_set(values):
+    # --set eta=0.2 --set M_0=[0.5,0] ; values are parsed as JSON when possible
+    overrides = {}
+    for item in values:
+        name, value = item.split("=", 1)
+        try:
+            overrides[name] = json.loads(value)
+        except json.JSONDecodeError:
+            overrides[name] = value
+    return overrides
+
+
+def _jobs_from_args(args, parser):
+    try:
+        return _load_jobs(args)
+    except (OSError, ValueError, ImportError) as exc:
+        parser.error(str(exc))
+
+
+def _load_jobs(args):
+    overrides = _parse_set(args.set)
+    if args.T is not None:
+        overrides['T'] = args.T
+    if args.seed is not None:
+        overrides['seed'] = args.seed
+
+    if not args.config:
+        return [make_job({**config_from_module(), 'name': 'config', **normalize_spec(overrides)})]
+    return [job for path in args.config for job in load_jobs(path, overrides)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m cli", description="Run the model without the app.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_job_options(p, many):
+        p.add_argument("config", nargs="*" if many else "?", default=[],
+                       help="JSON or YAML config (default: config.py)")
+        p.add_argument("--set", action="append", default=[], metavar="NAME=VALUE", help="override a parameter")
+        p.add_argument("--T", type=int, default=None, help="cycles per run")
+        p.add_argument("--seed", type=int, default=None)
+
+    run = commands.add_parser("run", help="run one simulation")
+    add_job_options(run, many=False)
+    run.add_argument("--out", default=None, help="output file: .npz, .trj or .json (default: summary to stdout)")
+    run.add_argument("--float32", action="store_true", help="store arrays as float32")
+    run.add_argument("--check-imports", action="store_true", help=argparse.SUPPRESS)
+
+    batch = commands.add_parser("batch", help="run every job of one or more configs")
+    add_job_options(batch, many=True)
+    batch.add_argument("--replicates", type=int, default=1, help="seeded runs per job, run as one ensemble")
+    batch.add_argument("--out", default=None, help="JSON-lines summary file (appended to)")
+
+    sweep = commands.add_parser("sweep", help="parameter sweep around a config (see sweep.py)")
+    add_job_options(sweep, many=False)
+    sweep.add_argument("--grid", action="append", default=[], metavar="NAME=LO:HI:N|V1,V2")
+    sweep.add_argument("--lhs", action="append", default=[], metavar="NAME=LO:HI")
+    sweep.add_argument("--samples", type=int, default=100)
+    sweep.add_argument("--replicates", type=int, default=1)
+    sweep.add_argument("--workers", type=int, default=None)
+    sweep.add_argument("--out", required=True, help="JSON-lines results file (appended to and resumed)")
+
+    basins = commands.add_parser("basins", help="noise-free regime map over two initial conditions (see basins.py)")
+    add_job_options(basins, many=False)
+    basins.add_argument("--x", default="M_0[0]=-2:2", metavar="AXIS=LO:HI", help="x axis: 'M_0[i]' or 'theta_0'")
+    basins.add_argument("--y", default="theta_0=0:1", metavar="AXIS=LO:HI")
+    basins.add_argument("--resolution", type=int, default=1000, help="pixels per side")
+    basins.add_argument("--coarse", type=int, default=None, help="first-level cell size in pixels")
+    basins.add_argument("--cache", default=None, help=".npz point cache, read if present and rewritten")
+    basins.add_argument("--out", required=True, help="output .npz (labels, xs, ys, axes, regimes)")
+
+    startup = commands.add_parser("startup", help="measure cold-start time against a target")
+    startup.add_argument("--repeats", type=int, default=5)
+    startup.add_argument("--target-ms", type=float, default=STARTUP_TARGET_MS)
+
+    args = parser.parse_args(argv)
+    if args.command in ("run", "sweep", "basins") and args.config:
+        args.config = [args.config]
+
+    if args.command == "run":
+        job = _jobs_from_args(args, parser)[0]
+        trajectory = run_job(job)
+        if args.out:
+            write_run(args.out, trajectory, job, args.float32)
+        else:
+            print(json.dumps(summarize(trajectory.theta, trajectory.eci)))
+        if args.check_imports:
+            loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+            if loaded:
+                sys.exit(f"headless run imported {loaded}")
+
+    elif args.command == "batch":
+        run_batch(_jobs_from_args(args, parser), args.replicates, args.out)
+
+    elif args.command == "sweep":
+        import sweep as sweeps
+
+        job = _jobs_from_args(args, parser)[0]
+        if bool(args.grid) == bool(args.lhs):
+            parser.error("give either --grid or --lhs axes")
+        if args.grid:
+            points = sweeps.grid_design(dict(sweeps._parse_axis(s) for s in args.grid))
+        else:
+            points = sweeps.latin_hypercube(dict(sweeps._parse_bounds(s) for s in args.lhs), args.samples, seed=job['seed'])
+        base = dict(_params(job), elite_data=job['elites'])
+        del base['seed'], base['elite_epsilon']
+        try:
+            records = sweeps.run_sweep(points, args.out, base=base, seed=job['seed'],
+                                       replicates=args.replicates, workers=args.workers)
+        except ValueError as exc:
+            parser.error(str(exc))
+        print(f"{len(records)} / {len(points)} points complete -> {args.out}")
+
+    elif args.command == "basins":
+        import basins as basin_maps
+
+        job = _jobs_from_args(args, parser)[0]
+        try:
+            (x_axis, x_range), (y_axis, y_range) = basin_maps._parse_range(args.x), basin_maps._parse_range(args.y)
+            mapper = basin_maps.BasinMapper(job['elites'], job['T'], job['eta'], job['kappa'], job['lambd'],
+                                            job['alpha'], job['theta_star'], job['M_0'], job['theta_0'],
+                                            axes=(x_axis, y_axis))
+        except ValueError as exc:
+            parser.error(str(exc))
+        if args.cache and os.path.exists(args.cache):
+            mapper.loadCache(args.cache)
+
+        start = time.perf_counter()
+        result = mapper.map(x_range, y_range, args.resolution,
+                            basin_maps.COARSE if args.coarse is None else args.coarse)
+        result.save(args.out)
+        if args.cache:
+            mapper.saveCache(args.cache)
+        shares = ", ".join(f"{name.lower()} {share:.1%}" for name, share in result.fractions().items())
+        print(f"{args.resolution}x{args.resolution} map in {time.perf_counter() - start:.1f} s, "
+              f"{result.simulated} runs simulated ({shares}) -> {args.out}")
+
+    else:
+        result = measure_startup(args.repeats, args.target_ms)
+        verdict = "ok" if result['ok'] else "OVER TARGET"
+        print(f"cold start: median {result['median_ms']:.0f} ms, best {result['best_ms']:.0f} ms "
+              f"(target {result['target_ms']:.0f} ms) {verdict}")
+        if not result['ok']:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,8 @@ K = 5                       # number of elites
 eta = 0.1                   # public learning rate
 kappa = 1.0                 # elite influence sensitivity
 lambd = 0.01                # responsiveness decay
+alpha = 0.1                 # responsiveness recovery rate
+theta_star = 0.8            # baseline responsiveness
 
 # initial conditions
 theta_0 = 0.7
@@ -7,17 +7,35 @@ class Dynamics:
         self.publicPreference = np.array(publicPreference)
         self.theta = theta
     
-    def updatePolicy(self, eliteInterest, publicInterest, theta):
-        eliteInterest = np.array(eliteInterest)
-        publicInterest = np.array(publicInterest)
-        self.policy = theta * publicInterest + (1 - theta) * eliteInterest
+    def updatePolicy(self, eliteInterest, publicInterest, theta, out=None):
+        """
+        O = theta * M + (1 - theta) * E, computed as E + theta * (M - E)
+
+        :param out: optional preallocated buffer for O; must not alias the inputs
+        """
+        eliteInterest = np.asarray(eliteInterest)
+        publicInterest = np.asarray(publicInterest)
+        if out is None:
+            out = np.empty(eliteInterest.shape)
+        np.subtract(publicInterest, eliteInterest, out=out)
+        out *= theta
+        out += eliteInterest
+        self.policy = out
         return self.policy
     
-    def updatePublicPreference(self, originalPublicPref, policyOutcome, eta, noise):
-        originalPublicPref = np.array(originalPublicPref)
-        policyOutcome = np.array(policyOutcome)
-        noise = np.array(noise)
-        self.publicPreference = originalPublicPref + eta * (policyOutcome - originalPublicPref) + noise
+    def updatePublicPreference(self, originalPublicPref, policyOutcome, eta, noise, out=None):
+        """
+        :param out: optional preallocated buffer for the new preference; must not alias the inputs
+        """
+        originalPublicPref = np.asarray(originalPublicPref)
+        policyOutcome = np.asarray(policyOutcome)
+        if out is None:
+            out = np.empty(originalPublicPref.shape)
+        np.subtract(policyOutcome, originalPublicPref, out=out)
+        out *= eta
+        out += originalPublicPref
+        out += noise
+        self.publicPreference = out
         return self.publicPreference
     
     def updateTheta(self, eci, lambd, alpha, theta_star):
@@ -26,6 +44,5 @@ class Dynamics:
         """
         recovery = alpha * (theta_star - self.theta)
         erosion = lambd * eci
-        self.theta = self.theta + recovery - erosion
-        self.theta = np.clip(self.theta, 0.0, 1.0)
+        self.theta = min(max(self.theta + recovery - erosion, 0.0), 1.0)
         return self.theta
\ No newline at end of file
@@ -1,51 +1,461 @@
 # elites.py
 import numpy as np
 
+from scenario import EliteSet
+from spatial import build_index, influence_radius
+
+# Row block size for the batched kernels; bounds the (rows, K, d) distance scratch
+BATCH_BLOCK = 256
+
+# Weight sums below this have underflowed (or lost precision as subnormals)
+_TINY = np.finfo(float).tiny
+
+# Default drop threshold of SparseElites
+DEFAULT_EPSILON = 1e-12
+
+# Batched distances use one matrix product per block once K * d reaches this (see BatchWorkspace)
+GEMM_MIN_WORK = 4096
+
+# Below this many active elites SparseElites stops querying its spatial index; a direct update is cheaper
+# (a 2-D grid query and nearest search cost about one distance pass over this many elites)
+INDEX_MIN_ACTIVE = 16384
+
 class Elites:
-    def __init__(self, elite_list):
+    def __init__(self, elite_list, d=None):
         """
         :param elite_list: list of dicts [{'name': str, 'x': float, 'y': float, 'weight': float}, ...]
+                           For d != 2 give 'position': sequence of length d instead of 'x' and 'y'.
+        :param d: policy dimension; required when elite_list is empty
+
+        A scenario.EliteSet is used as compiled: its read-only positions are shared, not copied,
+        and only the weights (updated in place) are copied.
         """
         self.elite_data = elite_list
-        
+        self._initialLog = None
+
+        if isinstance(elite_list, EliteSet):
+            self._initialLog = elite_list.log_weights
+            self._setArrays(elite_list.positions, elite_list.weights.copy(), list(elite_list.names))
+            return
+
         # Extract arrays for computation
         if len(elite_list) > 0:
-            self.positions = np.array([[e['x'], e['y']] for e in elite_list])
-            self.weights = np.array([e['weight'] for e in elite_list])
-            self.names = [e['name'] for e in elite_list]
+            positions = np.array([_elitePosition(e) for e in elite_list], dtype=float)
+            weights = np.array([e['weight'] for e in elite_list], dtype=float)
+            names = [e['name'] for e in elite_list]
         else:
-            self.positions = np.array([])
-            self.weights = np.array([])
-            self.names = []
-
-    def computeEliteCentroid(self):
-        if len(self.weights) == 0:
-            return np.array([0.0, 0.0])
-            
+            positions = np.empty((0, 2 if d is None else d))
+            weights = np.empty(0)
+            names = []
+
+        self._setArrays(positions, weights, names)
+
+    @classmethod
+    def fromArrays(cls, positions, weights, names=None):
+        """
+        Build directly from a dense (K, d) position matrix and (K,) weights, skipping dict parsing.
+        """
+        positions = np.ascontiguousarray(positions, dtype=float)
+        if positions.ndim != 2:
+            raise ValueError("positions must have shape (K, d)")
+        if names is None:
+            names = [f"Elite {i + 1}" for i in range(len(positions))]
+
+        elites = cls.__new__(cls)
+        elites.elite_data = None
+        elites._initialLog = None
+        elites._setArrays(positions, np.array(weights, dtype=float), list(names))
+        return elites
+
+    def _setArrays(self, positions, weights, names):
+        if len(weights) != len(positions):
+            raise ValueError("need exactly one weight per elite position")
+
+        self.positions = positions
+        self.weights = weights
+        self.names = names
+        self.d = positions.shape[1]
+
+        # Scratch buffers reused by every update, so the per-cycle kernels do not allocate
+        self._diff = np.empty_like(positions)
+        self._factor = np.empty(len(weights))
+
+    def computeEliteCentroid(self, out=None):
+        if out is None:
+            out = np.empty(self.d)
+
         # Weighted Average
         # We re-normalize weights for the centroid calculation if they drift
         total_weight = np.sum(self.weights)
         if total_weight == 0:
-            return np.array([0.0, 0.0])
-            
-        centroid = np.average(self.positions, axis=0, weights=self.weights)
-        return centroid
-    
+            out.fill(0.0)
+            return out
+
+        np.dot(self.weights, self.positions, out=out)
+        out /= total_weight
+        return out
+
     def updateWeights(self, weights, elitePoints, outcome, kappa):
         # We pass current_weights back in to keep state consistent across steps
-        weights = np.array(weights)
-        outcome = np.array(outcome)
+        weights = np.asarray(weights, dtype=float)
+        if weights is not self.weights:
+            self.weights = weights.copy()
 
         # Euclidean distance in policy space
-        distances = np.linalg.norm(elitePoints - outcome, axis=1)
+        # (tiling outcome first keeps the subtract off NumPy's buffered broadcast path)
+        np.copyto(self._diff, outcome)
+        np.subtract(elitePoints, self._diff, out=self._diff)
+        np.square(self._diff, out=self._diff)
+        distances = np.sum(self._diff, axis=1, out=self._factor)
+        np.sqrt(distances, out=distances)
 
         # Update weights (closer elites gain power)
-        unnormalized = weights * np.exp(-kappa * distances)
-        
+        distances *= -kappa
+        unnormalized = np.exp(distances, out=distances)
+        unnormalized *= weights
+
         total = np.sum(unnormalized)
-        if total == 0:
-             self.weights = weights 
+        if total >= _TINY:
+            np.divide(unnormalized, total, out=self.weights)
+        elif len(weights) > 0:
+            # Every w * exp(-kappa * d) underflowed; redo the update in log space, where it cannot
+            distances = np.sqrt(np.sum((elitePoints - outcome) ** 2, axis=1))
+            stable = _logSpaceWeights(weights, distances, kappa)
+            if np.isfinite(stable).all():
+                self.weights[:] = stable
+
+        return self.weights
+
+
+class SparseElites(Elites):
+    """
+    Elites with an active set, for very large K where most weights decay to nothing.
+
+    Weights of active elites are tracked in log space, so the multiplicative update never
+    underflows. After each update, elites whose normalized weight falls below epsilon leave
+    the active set for good (their weight becomes exactly 0). The centroid and the update then
+    cost O(active * d) instead of O(K * d); `weights` stays a dense (K,) array, refreshed only
+    at active and just-dropped entries.
+
+    Dropping is an approximation: a dropped elite had weight < epsilon when it left, but it
+    can no longer regain influence if O later moves toward it. Relative weights change by at
+    most exp(2 * kappa * distance O travels), so pick epsilon well below the inverse of that
+    over the horizon of interest; the dense and sparse runs then agree to roughly K * epsilon
+    times that factor.
+
+    With a spatial index (see spatial.py), each update first asks the index for the elites
+    within spatial.influence_radius of the outcome and drops the active elites outside it,
+    before computing any distances. Those are exactly elites whose updated weight would be
+    below epsilon anyway, so the error bound above is unchanged, and an update costs about
+    O(elites within the radius) plus the query. Since the dropped elites would leave at this
+    update anyway, the saving is the distances of elites about to leave: it pays off when
+    most of a large population leaves at once (e.g. a prebuilt index over clustered elites far
+    from the outcome). The query is skipped while the radius covers every indexed point. The
+    index is rebuilt over the active set whenever that has shrunk to half the indexed points;
+    it is not built for, and is dropped at, fewer than INDEX_MIN_ACTIVE active elites.
+    """
+
+    def __init__(self, elite_list, d=None, epsilon=DEFAULT_EPSILON, index=None):
+        """
+        :param epsilon: weight below which an elite leaves the active set
+        :param index: None for no spatial index, a spatial.build_index kind ('auto', 'kdtree', 'grid', 'brute'),
+                      or an index already built over these positions (to share one across runs)
+        """
+        self.epsilon = epsilon
+        self.indexKind = index
+        super().__init__(elite_list, d)
+
+    @classmethod
+    def fromArrays(cls, positions, weights, names=None, epsilon=DEFAULT_EPSILON, index=None):
+        elites = cls.__new__(cls)
+        elites.epsilon = epsilon
+        elites.indexKind = index
+        base = Elites.fromArrays(positions, weights, names)
+        elites.elite_data = None
+        elites._initialLog = None
+        elites._setArrays(base.positions, base.weights, base.names)
+        return elites
+
+    def _setArrays(self, positions, weights, names):
+        super()._setArrays(positions, weights, names)
+        self._scratch = np.empty(len(weights))
+        self._slot = np.full(len(weights), -1, dtype=np.int64)
+        self._activate(self.weights)
+
+    def _activate(self, weights):
+        # (Re)build the active set from dense weights; zero weights start inactive
+        self.weights = weights
+        self.active = np.flatnonzero(weights > 0)
+        self._activePositions = self.positions[self.active]
+        self._activeWeights = weights[self.active]
+        if self._initialLog is not None:
+            # Compiled elites come with their log-weights
+            self._activeLog = self._initialLog[self.active]
+            self._initialLog = None
+        else:
+            self._activeLog = np.log(self._activeWeights)
+
+        # Active slot of each elite (-1 if inactive), to map index hits onto the active arrays
+        self._slot.fill(-1)
+        self._slot[self.active] = np.arange(len(self.active))
+        self._heaviest = int(self._activeWeights.argmax()) if len(self.active) else -1
+
+        self._index = None
+        if isinstance(self.indexKind, str):
+            if len(self.active) >= INDEX_MIN_ACTIVE:
+                self._setIndex(build_index(self._activePositions, self.indexKind), self.active)
+        elif self.indexKind is not None:
+            if len(self.indexKind) != len(self.positions):
+                raise ValueError("a prebuilt index must cover all elite positions")
+            self._setIndex(self.indexKind, np.arange(len(self.positions)))
+
+    def _setIndex(self, index, ids):
+        # Index over the elites ids
+        self._index = index
+        self._indexIds = ids
+
+    def _keep(self, keep):
+        # Shrink the active set to the given slots (ascending); the rest get weight 0 for good.
+        # When few survive, clearing the dense arrays and restoring the survivors costs O(survivors)
+        # fancy indexing plus two memsets, instead of indexing every dropped elite.
+        kept = self.active[keep]
+        if 2 * len(kept) < len(self.active):
+            weights = self.weights[kept]
+            self.weights.fill(0.0)
+            self.weights[kept] = weights
+            self._slot.fill(-1)
+        else:
+            dropped = np.ones(len(self.active), dtype=bool)
+            dropped[keep] = False
+            dropped = self.active[dropped]
+            self.weights[dropped] = 0.0
+            self._slot[dropped] = -1
+        self.active = kept
+        self._slot[kept] = np.arange(len(kept))
+        self._activePositions = self._activePositions[keep]
+        self._activeWeights = self._activeWeights[keep]
+        self._activeLog = self._activeLog[keep]
+
+    def _restrictToRadius(self, outcome, kappa):
+        # Drop active elites beyond the influence radius, using the index instead of all distances.
+        # Both the heaviest and the nearest active elite give a valid radius; use the tighter one.
+        # No radius is below the nearest elite's distance plus ln(1 / epsilon) / kappa, so while that
+        # bound already covers the indexed bounding box nothing can be dropped and the index is skipped.
+        low, high = self._index.bounds
+        farthest = np.sqrt(np.sum(np.maximum(np.abs(outcome - low), np.abs(outcome - high)) ** 2))
+        closest = np.sqrt(np.sum((outcome - np.clip(outcome, low, high)) ** 2))
+        if influence_radius(closest, kappa, self.epsilon) >= farthest:
+            return
+
+        heavy = self._activeWeights[self._heaviest]
+        radius = influence_radius(
+            np.sqrt(np.sum((self._activePositions[self._heaviest] - outcome) ** 2)), kappa, self.epsilon
+        )
+        nearest = self._slot[self._indexIds[self._index.nearest(outcome)]]
+        if nearest >= 0:
+            radius = min(radius, influence_radius(
+                np.sqrt(np.sum((self._activePositions[nearest] - outcome) ** 2)), kappa, self.epsilon,
+                heavy / self._activeWeights[nearest]
+            ))
+        if not np.isfinite(radius) or radius >= farthest:
+            return
+
+        slots = self._slot[self._indexIds[self._index.queryRadius(outcome, radius)]]
+        slots = slots[slots >= 0]
+        if len(slots) < len(self.active):
+            self._keep(slots)
+
+        if 2 * len(self.active) <= len(self._index) and len(self.active) >= INDEX_MIN_ACTIVE:
+            self._setIndex(build_index(self._activePositions, self.indexKind if isinstance(self.indexKind, str) else 'auto'),
+                           self.active)
+
+    @property
+    def activeCount(self):
+        return len(self.active)
+
+    @property
+    def activeWeights(self):
+        # Weights of the active elites, aligned with self.active (a live buffer; copy to keep)
+        return self._activeWeights
+
+    def computeEliteCentroid(self, out=None):
+        if out is None:
+            out = np.empty(self.d)
+
+        total_weight = np.sum(self._activeWeights)
+        if total_weight == 0:
+            out.fill(0.0)
+            return out
+
+        np.dot(self._activeWeights, self._activePositions, out=out)
+        out /= total_weight
+        return out
+
+    def updateWeights(self, weights, elitePoints, outcome, kappa):
+        # Same contract as Elites.updateWeights; elitePoints must be self.positions
+        if weights is not self.weights:
+            self._activate(np.array(weights, dtype=float))
+
+        if len(self.active) == 0:
+            return self.weights
+        if self._index is not None and len(self.active) < INDEX_MIN_ACTIVE:
+            self._index = None
+        if self._index is not None:
+            self._restrictToRadius(outcome, kappa)
+        n = len(self.active)
+
+        # Distances to active elites only
+        diff = self._diff[:n]
+        np.copyto(diff, outcome)
+        np.subtract(self._activePositions, diff, out=diff)
+        np.square(diff, out=diff)
+        logits = np.sum(diff, axis=1, out=self._factor[:n])
+        np.sqrt(logits, out=logits)
+
+        # log w' = log w - kappa * d - logsumexp(log w - kappa * d), shifted by the max so exp cannot underflow
+        logits *= -kappa
+        logits += self._activeLog
+        logits -= logits.max()
+        normalized = np.exp(logits, out=self._scratch[:n])
+        total = np.sum(normalized)
+        logits -= np.log(total)
+        normalized /= total
+
+        np.copyto(self._activeLog, logits)
+        np.copyto(self._activeWeights, normalized)
+        self.weights[self.active] = normalized
+
+        # Drop elites that fell below epsilon (never the heaviest one)
+        threshold = min(self.epsilon, normalized.max())
+        if normalized.min() < threshold:
+            self._keep(np.flatnonzero(normalized >= threshold))
+        if self._index is not None:
+            self._heaviest = int(self._activeWeights.argmax())
+
+        return self.weights
+
+
+class BatchWorkspace:
+    def __init__(self, N, positions, block=BATCH_BLOCK):
+        """
+        Scratch buffers for centroidBatch and updateWeightsBatch, allocated once per batched
+        run of N rows instead of on every call.
+
+        For K * d >= GEMM_MIN_WORK, distances come from the expansion
+        |p|^2 - 2 o.p + |o|^2 as one matrix product per block, with |p|^2 computed here once;
+        the scratch is then (block, K) rather than (block, K, d). That form loses about
+        sqrt(machine epsilon) * |p| of absolute accuracy for nearly coincident points, so
+        smaller configurations keep the explicit differences, which match the scalar kernel.
+        """
+        self.positions = positions
+        K, d = positions.shape
+        self.block = max(min(N, block), 1)
+        self.gemm = K * d >= GEMM_MIN_WORK
+        self.factor = np.empty((self.block, K))
+        self.rowScratch = np.empty(self.block)
+        self.totals = np.empty(N)
+        self.live = np.empty(N, dtype=bool)
+        if self.gemm:
+            self.squaredNorms = np.einsum('kd,kd->k', positions, positions)
+            self.diff = None
+        else:
+            self.squaredNorms = None
+            self.diff = np.empty((self.block, K, d))
+
+
+def centroidBatch(weights, positions, out=None, workspace=None):
+    """
+    Elite centroids for N runs at once.
+
+    :param weights: (N, K) weights, one row per run
+    :param positions: (K, d) elite positions shared by all runs
+    :param out: optional (N, d) output buffer
+    :param workspace: optional BatchWorkspace for these N rows; avoids per-call temporaries
+    :return: (N, d) centroids, zero for runs whose weights sum to zero
+    """
+    N = len(weights)
+    if out is None:
+        out = np.empty((N, positions.shape[1]))
+    if workspace is None:
+        workspace = BatchWorkspace(N, positions)
+
+    np.dot(weights, positions, out=out)
+    total_weight = np.sum(weights, axis=1, out=workspace.totals[:N])
+    live = np.not_equal(total_weight, 0.0, out=workspace.live[:N])
+    np.divide(out, total_weight[:, None], out=out, where=live[:, None])
+    np.multiply(out, live[:, None], out=out)
+    return out
+
+
+def updateWeightsBatch(weights, positions, outcomes, kappa, workspace=None):
+    """
+    In-place weight update for N runs at once, the batched counterpart of Elites.updateWeights.
+
+    Works in blocks of BATCH_BLOCK runs through a BatchWorkspace (see there for how distances
+    are computed); pass one built once per run to keep the update allocation-free.
+
+    :param weights: (N, K) weights, overwritten with the normalized update
+    :param positions: (K, d) elite positions
+    :param outcomes: (N, d) policy outcomes
+    :param workspace: optional BatchWorkspace for these N rows and positions
+    """
+    N, K = weights.shape
+    if K == 0:
+        return weights
+    if workspace is None:
+        workspace = BatchWorkspace(N, positions)
+
+    block = workspace.block
+    for start in range(0, N, block):
+        stop = min(start + block, N)
+        n = stop - start
+        distances = workspace.factor[:n]
+        if workspace.gemm:
+            # |p - o|^2 = |p|^2 - 2 o.p + |o|^2, clipped at 0 against rounding
+            np.dot(outcomes[start:stop], positions.T, out=distances)
+            distances *= -2.0
+            distances += workspace.squaredNorms
+            norms = np.einsum('nd,nd->n', outcomes[start:stop], outcomes[start:stop], out=workspace.rowScratch[:n])
+            distances += norms[:, None]
+            np.maximum(distances, 0.0, out=distances)
         else:
-             self.weights = unnormalized / total
-             
-        return self.weights
\ No newline at end of file
+            diff = workspace.diff[:n]
+            np.subtract(positions[None, :, :], outcomes[start:stop, None, :], out=diff)
+            np.einsum('nkd,nkd->nk', diff, diff, out=distances)
+        np.sqrt(distances, out=distances)
+        distances *= -kappa
+        unnormalized = np.exp(distances, out=distances)
+        unnormalized *= weights[start:stop]
+
+        total = np.sum(unnormalized, axis=1, out=workspace.rowScratch[:n])
+        if total.min() >= _TINY:
+            np.divide(unnormalized, total[:, None], out=weights[start:stop])
+            continue
+
+        for row in range(n):
+            if total[row] >= _TINY:
+                np.divide(unnormalized[row], total[row], out=weights[start + row])
+                continue
+            # Every product of this row underflowed; redo it in log space
+            distances = np.sqrt(np.sum((positions - outcomes[start + row]) ** 2, axis=1))
+            stable = _logSpaceWeights(weights[start + row], distances, kappa)
+            if np.isfinite(stable).all():
+                weights[start + row] = stable
+
+    return weights
+
+
+def _logSpaceWeights(weights, distances, kappa):
+    # Normalized w * exp(-kappa * d) computed as a softmax of log w - kappa * d;
+    # all-NaN when every weight is zero (nothing to renormalize)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logits = np.log(weights) - kappa * distances
+        logits -= logits.max()
+        unnormalized = np.exp(logits)
+        return unnormalized / unnormalized.sum()
+
+
+def _elitePosition(elite):
+    if 'position' in elite:
+        return elite['position']
+    return [elite['x'], elite['y']]
@@ -0,0 +1,90 @@
+# ensemble.py
+import numpy as np
+
+from elites import BatchWorkspace, Elites, centroidBatch, updateWeightsBatch
+from utils import gaussian_noise, spawn_rngs
+
+
+def run_ensemble(N, T, M_0, theta_0, elite_data, eta, kappa, lambd, noise_scale, alpha, theta_star,
+                 seed=None, rngs=None, noise=None):
+    """
+    Batched version of simulation.run_simulation: advances N independent runs at once.
+
+    Each cycle follows the same seven stages as the scalar loop, but on stacked arrays:
+    M, E, O are (N, d), weights are (N, K) and theta is (N,).
+
+    :param N: number of independent runs
+    :param M_0: initial public preference, shape (d,) or (N, d)
+    :param theta_0: initial responsiveness, scalar or shape (N,)
+    :param seed: int or SeedSequence; run i uses the i-th of N streams from SeedSequence.spawn
+    :param rngs: optional list of N seeds or Generators instead of seed. Run i then matches
+                 run_simulation(..., rng=rngs[i])
+    :param noise: optional pre-drawn noise block of shape (N, T, d); overrides seed and rngs
+    :return: dict of stacked arrays 'M', 'E', 'O' (N, T, d), 'w' (N, T, K), 'theta' and 'eci' (N, T)
+    """
+    M_0 = np.asarray(M_0, dtype=float)
+    d = M_0.shape[-1]
+
+    elites = Elites(elite_data, d=d)
+    positions = elites.positions
+    K = len(elites.weights)
+
+    # State tracking, one row per run
+    M = np.broadcast_to(M_0, (N, d)).copy()
+    theta = np.broadcast_to(np.asarray(theta_0, dtype=float), (N,)).copy()
+    weights = np.broadcast_to(elites.weights.astype(float), (N, K)).copy()
+
+    # Noise for every run and cycle, drawn up front
+    if noise is None:
+        if rngs is None:
+            rngs = spawn_rngs(seed, N)
+        noise = np.empty((N, T, d))
+        for i in range(N):
+            noise[i] = gaussian_noise((T, d), noise_scale, rngs[i])
+    else:
+        noise = np.asarray(noise, dtype=float).reshape(N, T, d)
+
+    # Preallocated output columns
+    out = {
+        'M': np.empty((N, T, d)),
+        'E': np.empty((N, T, d)),
+        'O': np.empty((N, T, d)),
+        'w': np.empty((N, T, K)),
+        'theta': np.empty((N, T)),
+        'eci': np.empty((N, T)),
+    }
+
+    # Kernel scratch and the centroid buffer, allocated once for the whole run
+    workspace = BatchWorkspace(N, positions)
+    E = np.empty((N, d))
+
+    for t in range(T):
+        # 1. Compute Elite Centroid (zero where a run has no weight left)
+        centroidBatch(weights, positions, out=E, workspace=workspace)
+
+        # 2. Update Policy
+        O = E + theta[:, None] * (M - E)
+
+        # 3. Compute Metrics
+        numerator = np.linalg.norm(O - M, axis=1)
+        denominator = np.linalg.norm(E - M, axis=1) + 0.0001
+        eci = numerator / denominator
+
+        # 4. Update Public Preference
+        M = M + eta * (O - M) + noise[:, t]
+
+        # 5. Update Elite Weights
+        updateWeightsBatch(weights, positions, O, kappa, workspace=workspace)
+
+        # 6. Update Responsiveness
+        theta = np.clip(theta + alpha * (theta_star - theta) - lambd * eci, 0.0, 1.0)
+
+        # 7. Store State
+        out['M'][:, t] = M
+        out['E'][:, t] = E
+        out['O'][:, t] = O
+        out['w'][:, t] = weights
+        out['theta'][:, t] = theta
+        out['eci'][:, t] = eci
+
+    return out
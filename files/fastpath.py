@@ -0,0 +1,185 @@
+# fastpath.py
+import importlib.util
+
+import numpy as np
+
+from elites import Elites
+from dynamics import Dynamics
+from metrics import eliteCaptureIndex
+from trajectory import Trajectory
+
+# Numba is optional; without it the NumPy loop below is used. It is only imported on first use.
+HAVE_NUMBA = importlib.util.find_spec("numba") is not None
+
+
+def run_deterministic(T, M_0, theta_0, elite_data, eta, kappa, lambd, alpha, theta_star, tol=0.0, use_numba=None):
+    """
+    Noise-free run_simulation with fixed-point detection.
+
+    With noise_scale == 0 each cycle is a pure function of (M, w, theta). Once a cycle leaves all
+    three unchanged (within tol), every later cycle repeats it, so the loop stops there and the
+    remaining rows are filled with the last computed one. With tol=0 the result is exact.
+
+    :param tol: largest absolute change in M, w and theta still treated as "unchanged"
+    :param use_numba: True/False to force the compiled or NumPy loop; None uses Numba when installed
+    :return: (Trajectory, number of cycles actually computed)
+    """
+    elites = Elites(elite_data, d=len(M_0))
+    trajectory = Trajectory(T, len(M_0), len(elites.weights))
+
+    if use_numba is None:
+        use_numba = HAVE_NUMBA
+    if use_numba:
+        if not HAVE_NUMBA:
+            raise ImportError("use_numba=True requires the numba package")
+        computed = _compiledLoop()(
+            np.array(M_0, dtype=float), float(theta_0), elites.weights, elites.positions,
+            eta, kappa, lambd, alpha, theta_star, tol,
+            trajectory.M, trajectory.E, trajectory.O, trajectory.w, trajectory.theta, trajectory.eci
+        )
+    else:
+        computed = _numpyLoop(T, M_0, theta_0, elites, eta, kappa, lambd, alpha, theta_star, tol, trajectory)
+
+    # Past the fixed point every row repeats the last computed one
+    if computed < T:
+        last = computed - 1
+        for column in (trajectory.M, trajectory.E, trajectory.O, trajectory.w, trajectory.theta, trajectory.eci):
+            column[computed:] = column[last]
+
+    return trajectory, computed
+
+
+def _numpyLoop(T, M_0, theta_0, elites, eta, kappa, lambd, alpha, theta_star, tol, trajectory):
+    # Same stages and kernels as simulation.run_simulation, without the noise term
+    dynamics = Dynamics(policy=M_0, publicPreference=M_0, theta=theta_0)
+    M = np.array(M_0, dtype=float)
+    theta = theta_0
+    workspace = np.empty(len(M))
+    w_scratch = np.empty(len(elites.weights))
+
+    for t in range(T):
+        E = elites.computeEliteCentroid(out=trajectory.E[t])
+        O = dynamics.updatePolicy(E, M, theta, out=trajectory.O[t])
+        eci = eliteCaptureIndex(M, E, O, workspace=workspace)
+        M_next = dynamics.updatePublicPreference(M, O, eta, 0.0, out=trajectory.M[t])
+        elites.updateWeights(elites.weights, elites.positions, O, kappa)
+        theta_next = dynamics.updateTheta(eci, lambd, alpha, theta_star)
+
+        trajectory.w[t] = elites.weights
+        trajectory.theta[t] = theta_next
+        trajectory.eci[t] = eci
+
+        if t > 0 and (abs(theta_next - theta) <= tol
+                      and _settled(M_next, M, workspace, tol)
+                      and _settled(trajectory.w[t], trajectory.w[t - 1], w_scratch, tol)):
+            return t + 1
+
+        M = M_next
+        theta = theta_next
+
+    return T
+
+
+def _settled(a, b, scratch, tol):
+    np.subtract(a, b, out=scratch)
+    np.abs(scratch, out=scratch)
+    return len(scratch) == 0 or scratch.max() <= tol
+
+
+def _deterministicKernel(M, theta, w, P, eta, kappa, lambd, alpha, theta_star, tol,
+                         M_out, E_out, O_out, w_out, theta_out, eci_out):
+    # Scalar-loop form of one noise-free cycle, written for numba.njit
+    T = len(theta_out)
+    K, d = P.shape
+    w = w.copy()
+    M = M.copy()
+    E = np.empty(d)
+    O = np.empty(d)
+    u = np.empty(K)
+
+    for t in range(T):
+        # 1. Compute Elite Centroid
+        total_weight = 0.0
+        for k in range(K):
+            total_weight += w[k]
+        for j in range(d):
+            acc = 0.0
+            if total_weight != 0.0:
+                for k in range(K):
+                    acc += w[k] * P[k, j]
+                acc /= total_weight
+            E[j] = acc
+
+        # 2. Update Policy, 3. Compute Metrics
+        num = 0.0
+        den = 0.0
+        for j in range(d):
+            O[j] = E[j] + theta * (M[j] - E[j])
+            num += (O[j] - M[j]) ** 2
+            den += (E[j] - M[j]) ** 2
+        eci = np.sqrt(num) / (np.sqrt(den) + 0.0001)
+
+        # 4. Update Public Preference
+        change = 0.0
+        for j in range(d):
+            m = M[j] + eta * (O[j] - M[j])
+            change = max(change, abs(m - M[j]))
+            M[j] = m
+
+        # 5. Update Elite Weights
+        total = 0.0
+        for k in range(K):
+            dist = 0.0
+            for j in range(d):
+                dist += (P[k, j] - O[j]) ** 2
+            u[k] = w[k] * np.exp(-kappa * np.sqrt(dist))
+            total += u[k]
+        if total < 2.2250738585072014e-308:
+            # Every product underflowed; redo the update in log space (as Elites.updateWeights)
+            peak = -np.inf
+            for k in range(K):
+                if w[k] > 0.0:
+                    dist = 0.0
+                    for j in range(d):
+                        dist += (P[k, j] - O[j]) ** 2
+                    u[k] = np.log(w[k]) - kappa * np.sqrt(dist)
+                    peak = max(peak, u[k])
+            total = 0.0
+            if peak > -np.inf:
+                for k in range(K):
+                    u[k] = np.exp(u[k] - peak) if w[k] > 0.0 else 0.0
+                    total += u[k]
+        if total != 0.0:
+            for k in range(K):
+                v = u[k] / total
+                change = max(change, abs(v - w[k]))
+                w[k] = v
+
+        # 6. Update Responsiveness
+        theta_next = min(max(theta + alpha * (theta_star - theta) - lambd * eci, 0.0), 1.0)
+        change = max(change, abs(theta_next - theta))
+        theta = theta_next
+
+        # 7. Store State
+        M_out[t] = M
+        E_out[t] = E
+        O_out[t] = O
+        w_out[t] = w
+        theta_out[t] = theta
+        eci_out[t] = eci
+
+        if t > 0 and change <= tol:
+            return t + 1
+
+    return T
+
+
+_compiled = None
+
+def _compiledLoop():
+    # Compile on first use so importing this module stays cheap
+    global _compiled
+    if _compiled is None:
+        import numba
+        _compiled = numba.njit(cache=True)(_deterministicKernel)
+    return _compiled
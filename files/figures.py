@@ -0,0 +1,189 @@
+# figures.py
+"""
+Plotly figure builders for the app. Kept free of Streamlit so worker processes can build
+and serialize figures (see backend.py) without importing the UI.
+"""
+import json
+
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+
+# --- HELPER: POLITICAL COMPASS FIGURE ---
+def get_compass_fig(public_pos, policy_pos, elite_list, current_weights=None):
+    fig = go.Figure()
+
+    # 1. Background Quadrants
+    fig.add_shape(type="rect", x0=0, y0=0, x1=1.5, y1=1.5, 
+        fillcolor="rgba(50, 100, 255, 0.1)", layer="below", line_width=0)
+    fig.add_shape(type="rect", x0=-1.5, y0=0, x1=0, y1=1.5, 
+        fillcolor="rgba(255, 50, 50, 0.1)", layer="below", line_width=0)
+    fig.add_shape(type="rect", x0=-1.5, y0=-1.5, x1=0, y1=0, 
+        fillcolor="rgba(50, 200, 50, 0.1)", layer="below", line_width=0)
+    fig.add_shape(type="rect", x0=0, y0=-1.5, x1=1.5, y1=0, 
+        fillcolor="rgba(255, 200, 0, 0.1)", layer="below", line_width=0)
+
+    # 2. Elite Centroid
+    if elite_list:
+        e_x = [e['x'] for e in elite_list]
+        e_y = [e['y'] for e in elite_list]
+        w = current_weights if current_weights is not None else [e['weight'] for e in elite_list]
+        
+        if sum(w) > 0:
+            c_x = np.average(e_x, weights=w)
+            c_y = np.average(e_y, weights=w)
+            fig.add_trace(go.Scatter(
+                x=[c_x], y=[c_y], mode='markers', name='Elite Consensus',
+                marker=dict(size=22, color='purple', symbol='star', line=dict(width=2, color='white')),
+                hoverinfo='name'
+            ))
+
+    # 3. Elites
+    if elite_list:
+        e_names = [e['name'] for e in elite_list]
+        e_x = [e['x'] for e in elite_list]
+        e_y = [e['y'] for e in elite_list]
+        
+        if current_weights is not None:
+            sizes = [15 + (wt * 20) for wt in current_weights]
+            hover_txt = [f"{n}<br>Power: {wt:.2f}" for n, wt in zip(e_names, current_weights)]
+        else:
+            sizes = [15 + (e['weight'] * 20) for e in elite_list]
+            hover_txt = [f"{e['name']}<br>Init Power: {e['weight']:.2f}" for e in elite_list]
+
+        fig.add_trace(go.Scatter(
+            x=e_x, y=e_y, mode='markers+text', name='Individual Elites',
+            marker=dict(size=sizes, color='black', symbol='diamond', line=dict(width=1, color='white')),
+            text=e_names, textposition="top center",
+            hovertext=hover_txt, hoverinfo="text"
+        ))
+
+    # 4. Public
+    fig.add_trace(go.Scatter(
+        x=[public_pos[0]], y=[public_pos[1]], mode='markers', name='Public Opinion',
+        marker=dict(size=22, color='blue', symbol='circle', line=dict(width=2, color='white'))
+    ))
+
+    # 5. Policy
+    fig.add_trace(go.Scatter(
+        x=[policy_pos[0]], y=[policy_pos[1]], mode='markers', name='Policy Outcome',
+        marker=dict(size=20, color='green', symbol='x', line=dict(width=4, color='white'))
+    ))
+
+    fig.update_layout(
+        xaxis=dict(range=[-1.5, 1.5], title="Economic (Left ↔ Right)", zeroline=True, fixedrange=True, showgrid=False),
+        yaxis=dict(range=[-1.5, 1.5], title="Social (Lib ↔ Auth)", zeroline=True, fixedrange=True, showgrid=False),
+        height=550, margin=dict(l=20, r=20, t=30, b=20),
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+        plot_bgcolor="white", uirevision='constant'
+    )
+    return fig
+
+# --- HELPER: CLIENT-SIDE ANIMATION ---
+def get_compass_animation(data, elite_list, frame_ms=80):
+    """
+    One compass figure carrying every cycle as a Plotly frame, played back in the browser.
+    Uses the trajectory columns directly: E for the consensus star, w for elite marker sizes.
+    """
+    fig = get_compass_fig(data.M[0], data.O[0], elite_list, data.w[0])
+    e_names = [e['name'] for e in elite_list]
+    e_x = [e['x'] for e in elite_list]
+    e_y = [e['y'] for e in elite_list]
+
+    def frame_traces(i):
+        w = data.w[i]
+        return [
+            go.Scatter(x=[data.E[i][0]], y=[data.E[i][1]], mode='markers', name='Elite Consensus',
+                marker=dict(size=22, color='purple', symbol='star', line=dict(width=2, color='white')),
+                hoverinfo='name'),
+            go.Scatter(x=e_x, y=e_y, mode='markers+text', name='Individual Elites',
+                marker=dict(size=15 + w * 20, color='black', symbol='diamond', line=dict(width=1, color='white')),
+                text=e_names, textposition="top center",
+                hovertext=[f"{n}<br>Power: {wt:.2f}" for n, wt in zip(e_names, w)], hoverinfo="text"),
+            go.Scatter(x=[data.M[i][0]], y=[data.M[i][1]], mode='markers', name='Public Opinion',
+                marker=dict(size=22, color='blue', symbol='circle', line=dict(width=2, color='white'))),
+            go.Scatter(x=[data.O[i][0]], y=[data.O[i][1]], mode='markers', name='Policy Outcome',
+                marker=dict(size=20, color='green', symbol='x', line=dict(width=4, color='white'))),
+        ]
+
+    def frame_title(i):
+        return f"Cycle {data.t[i]} / {len(data)}  ·  Democracy Score {data.theta[i]:.2f}  ·  Elite Capture {data.eci[i]:.2f}"
+
+    # Every frame has the same four traces; without elites only public and policy are drawn
+    n_traces = 4 if elite_list else 2
+    fig.data = []
+    fig.add_traces(frame_traces(0)[-n_traces:])
+    fig.frames = [
+        go.Frame(data=frame_traces(i)[-n_traces:], name=str(i), layout=dict(title=dict(text=frame_title(i))))
+        for i in range(len(data))
+    ]
+
+    play_args = {'frame': {'duration': frame_ms, 'redraw': True}, 'fromcurrent': True, 'transition': {'duration': 0}}
+    pause_args = {'frame': {'duration': 0, 'redraw': False}, 'mode': 'immediate', 'transition': {'duration': 0}}
+    fig.update_layout(
+        title=dict(text=frame_title(0), font=dict(size=14)),
+        height=620, margin=dict(l=20, r=20, t=60, b=20),
+        updatemenus=[dict(
+            type="buttons", direction="left", showactive=False, x=0, y=-0.08, xanchor="left", yanchor="top",
+            buttons=[
+                dict(label="▶️ Play", method="animate", args=[None, play_args]),
+                dict(label="⏸ Pause", method="animate", args=[[None], pause_args]),
+            ]
+        )],
+        sliders=[dict(
+            x=0.2, len=0.8, y=-0.08, yanchor="top", currentvalue=dict(visible=False),
+            steps=[dict(method="animate", label=str(data.t[i]), args=[[str(i)], pause_args]) for i in range(len(data))]
+        )]
+    )
+    return fig
+
+def get_gauge_fig(value, title, color, frame_idx=0):
+    # Micro-adjustment to prevent duplicate ID error on static frames
+    unique_val = value + (frame_idx * 1e-9)
+    
+    fig = go.Figure(go.Indicator(
+        mode = "gauge+number",
+        value = unique_val,
+        title = {'text': title, 'font': {'size': 20, 'color': 'black'}},
+        number = {'font': {'size': 30}},
+        gauge = {
+            'axis': {'range': [None, 1], 'tickwidth': 1},
+            'bar': {'color': color},
+            'bgcolor': "white",
+            'borderwidth': 1,
+            'bordercolor': "gray",
+            'steps': [{'range': [0, 1], 'color': 'rgba(240, 242, 246, 0.5)'}]
+        }
+    ))
+    fig.update_layout(height=180, margin=dict(l=30, r=30, t=50, b=10)) 
+    return fig
+
+
+# --- SERIALIZED FIGURES ---
+def figure_json(fig):
+    # Plotly JSON of a built figure; validated once, when it was built
+    return pio.to_json(fig, validate=False)
+
+def load_figure(payload):
+    """
+    Figure from figure_json output without re-validating it, which costs as much as
+    building it again.
+    """
+    return go.Figure(json.loads(payload), _validate=False)
+
+def frame_payloads(frames, elite_list, first=0):
+    """
+    Serialized live-playback figures for a slice of a trajectory.
+
+    :param frames: the Trajectory rows to render
+    :param first: cycle index of frames[0] in the whole run (shown on the gauges)
+    :return: list of (compass, democracy gauge, capture gauge) JSON strings, one per frame
+    """
+    payloads = []
+    for i, frame in enumerate(frames, start=first):
+        payloads.append((
+            figure_json(get_compass_fig(frame.M, frame.O, elite_list, frame.w)),
+            figure_json(get_gauge_fig(frame.theta, "Democracy Score", "blue", i)),
+            figure_json(get_gauge_fig(frame.eci, "Elite Capture", "red", i)),
+        ))
+    return payloads
@@ -1,13 +1,22 @@
 # metrics.py
+import math
+
 import numpy as np
 
-def eliteCaptureIndex(publicPref, eliteCentroid, policyOutcome):
-    publicPref = np.array(publicPref)
-    eliteCentroid = np.array(eliteCentroid)
-    policyOutcome = np.array(policyOutcome)
+def eliteCaptureIndex(publicPref, eliteCentroid, policyOutcome, workspace=None):
+    """
+    :param workspace: optional scratch buffer of dimension d; avoids allocating the difference vectors
+    """
+    publicPref = np.asarray(publicPref)
+    eliteCentroid = np.asarray(eliteCentroid)
+    policyOutcome = np.asarray(policyOutcome)
+    if workspace is None:
+        workspace = np.empty(publicPref.shape)
 
-    numerator = np.linalg.norm(policyOutcome - publicPref)
-    denominator = np.linalg.norm(eliteCentroid - publicPref) + 0.0001  # 0.0001 prevents div by 0 error. 
+    np.subtract(policyOutcome, publicPref, out=workspace)
+    numerator = math.sqrt(np.dot(workspace, workspace))
+    np.subtract(eliteCentroid, publicPref, out=workspace)
+    denominator = math.sqrt(np.dot(workspace, workspace)) + 0.0001  # 0.0001 prevents div by 0 error. 
     # We will try to prevent the public preference from becoming the elite centroid
 
     return numerator / denominator
@@ -22,3 +31,70 @@ def policyDistance(a, b):
     a = np.array(a)
     b = np.array(b)
     return np.linalg.norm(a - b)
+
+# Regime verdicts from average responsiveness, best first, and the lower theta bound of each
+# (the last regime takes everything below)
+REGIMES = ("HEALTHY DEMOCRACY", "FLAWED DEMOCRACY", "OLIGARCHIC CAPTURE", "TOTAL OLIGARCHY")
+REGIME_THRESHOLDS = (0.70, 0.50, 0.30)
+
+# Cycles skipped before averaging theta and ECI for a verdict
+BURN_IN = 5
+
+def classify_regime(avg_theta):
+    """
+    Regime index into REGIMES for an average theta (0 = healthy ... 3 = total oligarchy).
+
+    :param avg_theta: scalar or array
+    :return: int for a scalar, else an int8 array of the same shape
+    """
+    avg_theta = np.asarray(avg_theta, dtype=float)
+    regime = len(REGIME_THRESHOLDS) - np.searchsorted(REGIME_THRESHOLDS[::-1], avg_theta, side='right')
+    if regime.ndim == 0:
+        return int(regime)
+    return regime.astype(np.int8)
+
+class RunningStats:
+    def __init__(self):
+        """
+        Streaming mean and variance (Welford), O(1) per update.
+        Values may be scalars or arrays of a fixed shape.
+        """
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def push(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean = self.mean + delta / self.count
+        self._m2 = self._m2 + delta * (x - self.mean)
+
+    def extend(self, values):
+        """
+        Merge a whole block of values at once (Chan et al. pairwise update).
+
+        :param values: array whose first axis indexes the samples
+        """
+        values = np.asarray(values)
+        n = len(values)
+        if n == 0:
+            return
+        block_mean = values.mean(axis=0)
+        block_m2 = ((values - block_mean) ** 2).sum(axis=0)
+
+        total = self.count + n
+        delta = block_mean - self.mean
+        self.mean = self.mean + delta * n / total
+        self._m2 = self._m2 + block_m2 + delta ** 2 * self.count * n / total
+        self.count = total
+
+    @property
+    def variance(self):
+        # Population variance, matching np.var
+        if self.count == 0:
+            return 0.0
+        return self._m2 / self.count
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
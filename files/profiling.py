@@ -0,0 +1,124 @@
+# profiling.py
+import time
+import tracemalloc
+
+# Sources of the allocations snapshot_diff leaves out
+_OWN_FILES = (tracemalloc.__file__, __file__)
+
+# The seven numbered stages of a simulation cycle, in loop order
+STAGES = ('centroid', 'policy', 'eci', 'public', 'weights', 'theta', 'store')
+
+
+class StageProfiler:
+    def __init__(self, trace_allocations=False):
+        """
+        Per-stage wall time and call counts for the simulation loop.
+
+        The loop calls start() at the top of each cycle and mark(stage) as each stage ends,
+        so a stage's time is the gap since the previous mark. Pass the profiler to
+        run_simulation / iter_simulation; with profiler=None the loop skips every hook.
+
+        :param trace_allocations: also record, per stage, the net change in the number of live
+                                  allocated blocks and in their bytes (see snapshot_diff), and the
+                                  largest transient peak in bytes, using tracemalloc (slow). The
+                                  counts compare snapshots taken between stages, so temporaries
+                                  freed within a stage are not counted; they show in the peak.
+        """
+        self.trace_allocations = trace_allocations
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.calls = dict.fromkeys(STAGES, 0)
+        self.net_allocations = dict.fromkeys(STAGES, 0)
+        self.net_bytes = dict.fromkeys(STAGES, 0)
+        self.peak_bytes = dict.fromkeys(STAGES, 0)
+        self._last = None
+        self._memory = 0
+        self._snapshot = None
+        self._started_tracing = False
+
+    def start(self):
+        if self.trace_allocations:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            self._snapshot = tracemalloc.take_snapshot()
+            self._memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self._last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.seconds[stage] += now - self._last
+        self.calls[stage] += 1
+
+        if self.trace_allocations:
+            peak = tracemalloc.get_traced_memory()[1] - self._memory
+            self.peak_bytes[stage] = max(self.peak_bytes[stage], peak)
+            snapshot = tracemalloc.take_snapshot()
+            blocks, size = snapshot_diff(self._snapshot, snapshot)
+            self.net_allocations[stage] += blocks
+            self.net_bytes[stage] += size
+            # Measure the next stage from here, past the snapshot's own memory
+            self._snapshot = snapshot
+            self._memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            now = time.perf_counter()
+
+        self._last = now
+
+    def stop(self):
+        self._snapshot = None
+        # Stop tracemalloc if this profiler started it
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def report(self):
+        """
+        :return: list of dicts, one per stage in loop order, with seconds, calls, mean_us and share
+                 (fraction of the total), plus net_allocations, net_bytes and peak_bytes when
+                 tracing allocations
+        """
+        total = sum(self.seconds.values()) or 1.0
+        rows = []
+        for stage in STAGES:
+            calls = self.calls[stage]
+            row = {
+                'stage': stage,
+                'seconds': self.seconds[stage],
+                'calls': calls,
+                'mean_us': self.seconds[stage] / calls * 1e6 if calls else 0.0,
+                'share': self.seconds[stage] / total,
+            }
+            if self.trace_allocations:
+                row['net_allocations'] = self.net_allocations[stage]
+                row['net_bytes'] = self.net_bytes[stage]
+                row['peak_bytes'] = self.peak_bytes[stage]
+            rows.append(row)
+        return rows
+
+    def table(self):
+        header = f"{'stage':<10} {'calls':>8} {'mean us':>10} {'total s':>10} {'share':>7}"
+        if self.trace_allocations:
+            header += f" {'net allocs':>11} {'net bytes':>11} {'peak bytes':>11}"
+        lines = [header]
+        for row in self.report():
+            line = (f"{row['stage']:<10} {row['calls']:>8} {row['mean_us']:>10.2f} "
+                    f"{row['seconds']:>10.4f} {row['share']:>6.1%}")
+            if self.trace_allocations:
+                line += f" {row['net_allocations']:>11} {row['net_bytes']:>11} {row['peak_bytes']:>11}"
+            lines.append(line)
+        return "\n".join(lines)
+
+
+def snapshot_diff(before, after):
+    """
+    :return: (blocks, bytes), the net change in live allocated blocks and in their total size
+             between two tracemalloc snapshots, leaving out the blocks allocated by tracemalloc
+             and this module (the snapshots and the profiler's own bookkeeping)
+    """
+    blocks = size = 0
+    for stat in after.compare_to(before, 'filename'):
+        if stat.traceback[0].filename not in _OWN_FILES:
+            blocks += stat.count_diff
+            size += stat.size_diff
+    return blocks, size
@@ -0,0 +1,375 @@
+# scenario.py
+"""
+Compiled scenarios: a model configuration validated once and frozen into contiguous,
+read-only arrays, with a stable content hash.
+
+An EliteSet is also the tuple of its elite dicts, so it can be passed anywhere an elite
+list is accepted (run_simulation, run_ensemble, the service, JSON output); Elites and
+cache.simulation_key use its arrays and digest directly instead of re-parsing the dicts.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+import config
+
+# Model parameters of a scenario, in run_simulation order (the elites come after M_0 and theta_0)
+PARAMS = ('T', 'M_0', 'theta_0', 'eta', 'kappa', 'lambd', 'noise_scale', 'alpha', 'theta_star')
+
+# Settings a scenario spec may give besides PARAMS and the elites
+OPTIONS = ('seed', 'elite_epsilon', 'name')
+
+# Values for whatever a scenario leaves out, from config.py (shared by the CLI and sweep.py)
+DEFAULTS = {
+    'T': config.T,
+    'M_0': [float(m) for m in config.M_0],
+    'theta_0': config.theta_0,
+    'eta': config.eta,
+    'kappa': config.kappa,
+    'lambd': config.lambd,
+    'noise_scale': config.noise_scale,
+    'alpha': config.alpha,
+    'theta_star': config.theta_star,
+    'seed': 0,
+    'elite_epsilon': None,
+    'elites': config.eliteInfoDict,
+}
+
+# Compiled scenarios per config file (this process only), keyed by path, version, overrides and defaults
+_FILE_CACHE = {}
+
+
+def _frozen(values):
+    array = np.array(values, dtype=float, order='C')
+    array.flags.writeable = False
+    return array
+
+
+def _digest(records):
+    blob = json.dumps(records, separators=(',', ':'))
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+def elite_records(elite_data):
+    """
+    [name, position, weight] of each elite, in order, as a str, a list of float and a float;
+    the same for an EliteSet and the dicts it was compiled from.
+    """
+    if isinstance(elite_data, EliteSet):
+        return [[n, p, w] for n, p, w in zip(elite_data.names, elite_data.positions.tolist(), elite_data.weights.tolist())]
+    return [
+        [str(e['name']), [float(x) for x in e.get('position', (e.get('x'), e.get('y')))], float(e['weight'])]
+        for e in elite_data
+    ]
+
+
+def elites_digest(elite_data):
+    """
+    sha256 of elite_records(elite_data); precomputed for an EliteSet.
+    """
+    if isinstance(elite_data, EliteSet):
+        return elite_data.digest
+    return _digest(elite_records(elite_data))
+
+
+class EliteSet(tuple):
+    def __new__(cls, positions, weights, names=None):
+        """
+        Validated, immutable elites.
+
+        `positions` (K, d), `weights` and `log_weights` (K,) are C-contiguous read-only float
+        arrays and `names` a tuple of str. As a tuple, an EliteSet holds one dict per elite:
+        {'name', 'x', 'y', 'weight'} when d == 2, else {'name', 'position', 'weight'}. Those
+        dicts are copies for code that reads elite lists; the arrays are authoritative.
+
+        :param positions: (K, d) elite positions; K may be 0 if the array still has d columns
+        :param weights: (K,) non-negative initial weights
+        :param names: K names (default "Elite 1", "Elite 2", ...)
+        """
+        positions = _frozen(positions)
+        weights = _frozen(weights)
+        if positions.ndim != 2:
+            raise ValueError("elite positions must have shape (K, d)")
+        K, d = positions.shape
+        if weights.shape != (K,):
+            raise ValueError("need exactly one weight per elite position")
+        if not np.all(np.isfinite(positions)):
+            raise ValueError("elite positions must be finite")
+        if not np.all(np.isfinite(weights)) or np.any(weights < 0):
+            raise ValueError("elite weights must be finite and non-negative")
+        names = tuple(f"Elite {i + 1}" for i in range(K)) if names is None else tuple(str(n) for n in names)
+        if len(names) != K:
+            raise ValueError("need exactly one name per elite")
+
+        with np.errstate(divide='ignore'):
+            log_weights = _frozen(np.log(weights))
+
+        rows = positions.tolist()
+        if d == 2:
+            records = [{'name': n, 'x': p[0], 'y': p[1], 'weight': w} for n, p, w in zip(names, rows, weights.tolist())]
+        else:
+            records = [{'name': n, 'position': p, 'weight': w} for n, p, w in zip(names, rows, weights.tolist())]
+
+        elites = super().__new__(cls, records)
+        for attribute, value in (('positions', positions), ('weights', weights), ('log_weights', log_weights),
+                                 ('names', names), ('d', d)):
+            object.__setattr__(elites, attribute, value)
+        object.__setattr__(elites, 'digest', _digest([[n, p, w] for n, p, w in zip(names, rows, weights.tolist())]))
+        return elites
+
+    def __setattr__(self, name, value):
+        raise AttributeError("EliteSet is immutable")
+
+    def __reduce__(self):
+        return (EliteSet, (self.positions, self.weights, self.names))
+
+    @classmethod
+    def fromList(cls, elite_list, d=None):
+        """
+        :param elite_list: list of dicts [{'name', 'x', 'y' (or 'position'), 'weight'}, ...]; names are optional
+        :param d: policy dimension; required when elite_list is empty
+        """
+        if isinstance(elite_list, EliteSet):
+            return elite_list
+        if len(elite_list) == 0:
+            return cls(np.empty((0, 2 if d is None else d)), np.empty(0), ())
+
+        positions, weights, names = [], [], []
+        for i, elite in enumerate(elite_list):
+            if 'weight' not in elite or not ('position' in elite or ('x' in elite and 'y' in elite)):
+                raise ValueError(f"elite {i + 1} needs a weight and either 'position' or 'x' and 'y'")
+            positions.append(elite['position'] if 'position' in elite else (elite['x'], elite['y']))
+            weights.append(elite['weight'])
+            names.append(elite.get('name', f"Elite {i + 1}"))
+
+        lengths = {len(p) for p in positions}
+        if len(lengths) != 1:
+            raise ValueError("all elite positions must have the same dimension")
+        return cls(positions, weights, names)
+
+    @classmethod
+    def fromDict(cls, elite_info):
+        """
+        :param elite_info: config.py's eliteInfoDict, {(x, y, ...): weight}; keys may also be
+                           strings "x,y" or "(x, y)" (JSON and YAML mappings cannot have list keys)
+        """
+        positions, weights = [], []
+        for position, weight in elite_info.items():
+            if isinstance(position, str):
+                position = [float(x) for x in position.strip("()[] ").split(",")]
+            positions.append(position)
+            weights.append(weight)
+        return cls(np.array(positions, dtype=float).reshape(len(positions), -1), weights)
+
+
+def compile_elites(spec, d=None):
+    """
+    EliteSet from any accepted elite form:
+      - an EliteSet (returned as is)
+      - config.py's eliteInfoDict, {(x, y): weight} or with "x,y" string keys
+      - a list of [[x, y, ...], weight] pairs
+      - the app's list of {'name', 'x', 'y', 'weight'} or {'name', 'position', 'weight'} dicts
+    """
+    if isinstance(spec, EliteSet):
+        return spec
+    if isinstance(spec, dict):
+        return EliteSet.fromDict(spec)
+
+    items = list(spec)
+    if items and not isinstance(items[0], dict):
+        pairs = [{'name': f"Elite {i + 1}", 'position': [float(x) for x in p], 'weight': float(w)}
+                 for i, (p, w) in enumerate(items)]
+        return EliteSet.fromList(pairs, d)
+    return EliteSet.fromList(items, d)
+
+
+class Scenario:
+    def __init__(self, elites, T, M_0, theta_0, eta, kappa, lambd, noise_scale, alpha, theta_star,
+                 seed=None, elite_epsilon=None, name=None):
+        """
+        One validated, immutable model configuration.
+
+        :param elites: any form accepted by compile_elites
+        :param seed: int noise seed, or None (the run is then only reproducible without noise)
+        :param elite_epsilon: SparseElites drop threshold, or None for the dense model
+        """
+        M_0 = _frozen(M_0).reshape(-1)
+        elites = compile_elites(elites, d=len(M_0))
+
+        values = {'theta_0': theta_0, 'eta': eta, 'kappa': kappa, 'lambd': lambd, 'noise_scale': noise_scale,
+                  'alpha': alpha, 'theta_star': theta_star, 'T': T, 'seed': seed, 'elite_epsilon': elite_epsilon}
+        for key, value in values.items():
+            if value is None and key in ('seed', 'elite_epsilon'):
+                continue
+            if isinstance(value, bool) or not isinstance(value, (int, float, np.number)):
+                raise ValueError(f"scenario {name!r}: {key} must be a number, got {value!r}")
+        T, seed, elite_epsilon = values.pop('T'), values.pop('seed'), values.pop('elite_epsilon')
+
+        problems = []
+        if int(T) != T or T < 1:
+            problems.append("T must be a positive integer")
+        if len(M_0) == 0 or not np.all(np.isfinite(M_0)):
+            problems.append("M_0 must be a non-empty finite vector")
+        elif elites.d != len(M_0):
+            problems.append(f"elite positions have dimension {elites.d} but M_0 has {len(M_0)}")
+        for key, value in values.items():
+            if not np.isfinite(value):
+                problems.append(f"{key} must be finite")
+        for key in ('theta_0', 'theta_star', 'eta', 'alpha'):
+            if not 0.0 <= values[key] <= 1.0:
+                problems.append(f"{key} must lie in [0, 1]")
+        for key in ('kappa', 'lambd', 'noise_scale'):
+            if values[key] < 0:
+                problems.append(f"{key} must be non-negative")
+        if seed is not None and int(seed) != seed:
+            problems.append("seed must be an integer or None")
+        if elite_epsilon is not None and not 0.0 < elite_epsilon < 1.0:
+            problems.append("elite_epsilon must lie in (0, 1)")
+        if problems:
+            prefix = f"scenario {name!r}: " if name else ""
+            raise ValueError(prefix + "; ".join(problems))
+
+        state = dict({k: float(v) for k, v in values.items()}, T=int(T), M_0=M_0, elites=elites,
+                     seed=None if seed is None else int(seed),
+                     elite_epsilon=None if elite_epsilon is None else float(elite_epsilon), name=name)
+        self.__dict__.update(state)
+        self.__dict__['_key'] = None
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Scenario is immutable; use replace()")
+
+    def __reduce__(self):
+        return (_scenario_from_dict, (self.toDict(),))
+
+    def __repr__(self):
+        return f"Scenario({self.name!r}, K={len(self.elites)}, d={len(self.M_0)}, key={self.key[:12]})"
+
+    @classmethod
+    def fromSpec(cls, spec, defaults=None):
+        """
+        :param spec: dict of PARAMS and OPTIONS, plus the elites as 'elites' (app or pair
+                     form) or 'eliteInfoDict' (config.py form); unknown keys are rejected
+        :param defaults: values for whatever spec leaves out (elites included)
+        """
+        spec = {**normalize_spec(defaults or {}), **normalize_spec(spec)}
+        unknown = set(spec) - set(PARAMS) - set(OPTIONS) - {'elites'}
+        if unknown:
+            raise ValueError(f"Unknown config keys {sorted(unknown)}; expected {PARAMS + OPTIONS}, "
+                             f"'elites' or 'eliteInfoDict'")
+        missing = [key for key in PARAMS + ('elites',) if key not in spec]
+        if missing:
+            raise ValueError(f"scenario is missing {missing}")
+        return cls(**spec)
+
+    @classmethod
+    def fromModule(cls, module, defaults=None, name=None):
+        """
+        Scenario from a config.py-style module (T, M_0, theta_0, eta, ..., eliteInfoDict).
+        """
+        spec = {key: getattr(module, key) for key in PARAMS + OPTIONS if hasattr(module, key)}
+        spec['elites'] = module.eliteInfoDict
+        if name is not None:
+            spec['name'] = name
+        return cls.fromSpec(spec, defaults)
+
+    def replace(self, **changes):
+        # A new validated scenario with some settings changed
+        return Scenario.fromSpec({**self.toDict(), 'elites': self.elites, **changes})
+
+    def args(self):
+        """
+        Positional run_simulation arguments: (T, M_0, theta_0, elites, eta, kappa, lambd,
+        noise_scale, alpha, theta_star); M_0 is a read-only array, elites the EliteSet.
+        """
+        return (self.T, self.M_0, self.theta_0, self.elites, self.eta, self.kappa, self.lambd,
+                self.noise_scale, self.alpha, self.theta_star)
+
+    @property
+    def key(self):
+        """
+        Stable sha256 of everything that determines the run: cache.simulation_key of args()
+        and the seed, extended with elite_epsilon when set. Computed once.
+        """
+        if self._key is None:
+            from cache import simulation_key
+
+            key = simulation_key(*self.args(), self.seed)
+            if self.elite_epsilon is not None:
+                key = hashlib.sha256(f"{key}|elite_epsilon={self.elite_epsilon!r}".encode()).hexdigest()
+            self.__dict__['_key'] = key
+        return self._key
+
+    def toDict(self):
+        """
+        JSON-ready spec that fromSpec turns back into an equal scenario.
+        """
+        spec = {key: getattr(self, key) for key in PARAMS + OPTIONS}
+        spec['M_0'] = self.M_0.tolist()
+        spec['elites'] = [dict(e) for e in self.elites]
+        return spec
+
+
+def normalize_spec(spec):
+    """
+    One layer of a spec with config.py's 'eliteInfoDict' renamed to 'elites'.
+
+    Layers are normalized before they are merged, so a later layer's elites replace an
+    earlier layer's whichever key either uses.
+
+    :raises ValueError: if the layer sets both keys
+    """
+    if 'eliteInfoDict' not in spec:
+        return spec
+    if 'elites' in spec:
+        raise ValueError("give the elites as either 'elites' or 'eliteInfoDict', not both")
+    spec = dict(spec)
+    spec['elites'] = spec.pop('eliteInfoDict')
+    return spec
+
+
+def _scenario_from_dict(spec):
+    return Scenario.fromSpec(spec)
+
+
+def load_scenarios(path, overrides=None, defaults=None):
+    """
+    Compile every scenario of a JSON or YAML config file (by extension; YAML needs PyYAML).
+
+    A file holds one scenario, or {"jobs": [...]} with optional shared settings at the top
+    level. Unnamed scenarios are named after the file. Results are kept per file version, so
+    reloading presets for many batch jobs does not parse or validate them again.
+
+    :param overrides: settings applied on top of every scenario
+    :param defaults: values for whatever a scenario leaves out
+    :return: list of Scenario
+    """
+    stat = os.stat(path)
+    cache_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, repr(overrides), repr(defaults))
+    scenarios = _FILE_CACHE.get(cache_key)
+    if scenarios is not None:
+        return list(scenarios)
+
+    with open(path) as f:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("YAML configs require the PyYAML package") from None
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+
+    overrides = normalize_spec(overrides or {})
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if 'jobs' not in data:
+        specs = [{'name': stem, **normalize_spec(data), **overrides}]
+    else:
+        shared = normalize_spec({k: v for k, v in data.items() if k != 'jobs'})
+        specs = [{'name': f"{stem}[{i}]", **shared, **normalize_spec(job), **overrides}
+                 for i, job in enumerate(data['jobs'])]
+
+    scenarios = [Scenario.fromSpec(spec, defaults) for spec in specs]
+    _FILE_CACHE[cache_key] = tuple(scenarios)
+    return scenarios
@@ -0,0 +1,160 @@
+# sensitivity.py
+import numpy as np
+
+from elites import Elites
+from metrics import BURN_IN
+from utils import gaussian_noise, spawn_rngs
+
+# Parameters derivatives can be taken with respect to
+PARAMS = ('eta', 'kappa', 'lambd', 'alpha', 'theta_star')
+
+# Same stabilizer as metrics.eliteCaptureIndex
+ECI_EPS = 0.0001
+
+
+def run_sensitivity(N, T, M_0, theta_0, elite_data, eta, kappa, lambd, noise_scale, alpha, theta_star,
+                    seed=None, rngs=None, noise=None, wrt=PARAMS, burn_in=BURN_IN):
+    """
+    Forward-mode (tangent-linear) derivatives of theta and ECI with respect to model parameters.
+
+    Runs N simulations like ensemble.run_ensemble and, in the same pass, carries the derivative
+    of every state variable (M, elite weights, theta) with respect to each parameter in wrt
+    through all six stages: centroid, policy, ECI, public update, weight update and the
+    clipped theta update. Where the clip in updateTheta is active the derivative of theta is
+    zero (a one-sided choice exactly at 0 or 1); weights that underflowed to 0 stay there with
+    zero derivative. The noise is held fixed, so the derivatives are those of each seeded path.
+
+    Parameters may be scalars or arrays of shape (N,), so one call evaluates N different points.
+
+    :param seed, rngs, noise: noise streams, exactly as for run_ensemble
+    :param wrt: parameters to differentiate with respect to, a subset of PARAMS
+    :param burn_in: cycles skipped by the mean_* outputs (ignored when T <= burn_in)
+    :return: dict with 'final_theta', 'mean_theta', 'final_eci', 'mean_eci' of shape (N,), a
+             'd_' + name gradient of shape (N, len(wrt)) for each of them, and 'wrt'
+    """
+    wrt = tuple(wrt)
+    unknown = set(wrt) - set(PARAMS)
+    if unknown:
+        raise ValueError(f"Cannot differentiate with respect to {sorted(unknown)}; choose from {PARAMS}")
+    column = {name: i for i, name in enumerate(wrt)}
+    P = len(wrt)
+
+    M_0 = np.asarray(M_0, dtype=float)
+    d = M_0.shape[-1]
+    elites = Elites(elite_data, d=d)
+    positions = elites.positions
+    K = len(elites.weights)
+
+    eta, kappa, lambd, alpha, theta_star = (
+        np.broadcast_to(np.asarray(p, dtype=float), (N,)).copy() for p in (eta, kappa, lambd, alpha, theta_star)
+    )
+
+    # State and tangents, one row per run; tangents carry a trailing parameter axis
+    M = np.broadcast_to(M_0, (N, d)).copy()
+    theta = np.broadcast_to(np.asarray(theta_0, dtype=float), (N,)).copy()
+    w = np.broadcast_to(elites.weights, (N, K)).copy()
+    dM = np.zeros((N, d, P))
+    dtheta = np.zeros((N, P))
+    dw = np.zeros((N, K, P))
+
+    if noise is None:
+        if rngs is None:
+            rngs = spawn_rngs(seed, N)
+        noise = np.stack([gaussian_noise((T, d), noise_scale, rngs[i]) for i in range(N)])
+    else:
+        noise = np.asarray(noise, dtype=float).reshape(N, T, d)
+
+    burn_in = burn_in if T > burn_in else 0
+    sum_theta = np.zeros(N)
+    sum_eci = np.zeros(N)
+    dsum_theta = np.zeros((N, P))
+    dsum_eci = np.zeros((N, P))
+
+    for t in range(T):
+        # 1. Compute Elite Centroid: E = sum_k w_k p_k / S
+        S = w.sum(axis=1)
+        live = S != 0
+        safe_S = np.where(live, S, 1.0)
+        E = np.where(live[:, None], (w @ positions) / safe_S[:, None], 0.0)
+        dE = np.einsum('nkp,kd->ndp', dw, positions) - E[:, :, None] * dw.sum(axis=1)[:, None, :]
+        dE *= np.where(live, 1.0 / safe_S, 0.0)[:, None, None]
+
+        # 2. Update Policy: O = E + theta (M - E)
+        O = E + theta[:, None] * (M - E)
+        dO = dE + dtheta[:, None, :] * (M - E)[:, :, None] + theta[:, None, None] * (dM - dE)
+
+        # 3. Compute Metrics: ECI = |O - M| / (|E - M| + eps)
+        a = O - M
+        b = E - M
+        norm_a = np.linalg.norm(a, axis=1)
+        norm_b = np.linalg.norm(b, axis=1)
+        dnorm_a = _normTangent(a, norm_a, dO - dM)
+        dnorm_b = _normTangent(b, norm_b, dE - dM)
+        denominator = norm_b + ECI_EPS
+        eci = norm_a / denominator
+        deci = (dnorm_a - eci[:, None] * dnorm_b) / denominator[:, None]
+
+        # 4. Update Public Preference: M' = M + eta (O - M) + noise
+        M_next = M + eta[:, None] * a + noise[:, t]
+        dM = dM + eta[:, None, None] * (dO - dM)
+        if 'eta' in column:
+            dM[:, :, column['eta']] += a
+
+        # 5. Update Elite Weights: w'_k = w_k exp(-kappa D_k) / Z, in log space
+        diff = positions[None, :, :] - O[:, None, :]
+        D = np.linalg.norm(diff, axis=2)
+        with np.errstate(divide='ignore'):
+            logits = np.log(w) - kappa[:, None] * D
+        peak = logits.max(axis=1, keepdims=True)
+        log_Z = peak + np.log(np.exp(logits - peak).sum(axis=1, keepdims=True))
+        q = np.exp(-kappa[:, None] * D - log_Z)           # w'_k / w_k, finite even where w_k is 0
+        w_next = w * q
+
+        # dD_k = -(p_k - O) . dO / D_k
+        dD = -np.einsum('nkd,ndp->nkp', diff, dO) / np.where(D > 0, D, np.inf)[:, :, None]
+        h = -kappa[:, None, None] * dD
+        if 'kappa' in column:
+            h[:, :, column['kappa']] -= D
+        g = q[:, :, None] * dw + w_next[:, :, None] * h
+        dw = g - w_next[:, :, None] * g.sum(axis=1)[:, None, :]
+
+        # 6. Update Responsiveness: theta' = clip(theta + alpha (theta* - theta) - lambd ECI, 0, 1)
+        raw = theta + alpha * (theta_star - theta) - lambd * eci
+        draw = (1.0 - alpha)[:, None] * dtheta - lambd[:, None] * deci
+        if 'alpha' in column:
+            draw[:, column['alpha']] += theta_star - theta
+        if 'theta_star' in column:
+            draw[:, column['theta_star']] += alpha
+        if 'lambd' in column:
+            draw[:, column['lambd']] -= eci
+        inside = (raw >= 0.0) & (raw <= 1.0)
+        theta = np.clip(raw, 0.0, 1.0)
+        dtheta = draw * inside[:, None]
+
+        M = M_next
+        w = w_next
+
+        # 7. Accumulate outputs (theta as stored after the update, as in the trajectory)
+        if t >= burn_in:
+            sum_theta += theta
+            sum_eci += eci
+            dsum_theta += dtheta
+            dsum_eci += deci
+
+    count = T - burn_in
+    return {
+        'wrt': wrt,
+        'final_theta': theta,
+        'd_final_theta': dtheta,
+        'mean_theta': sum_theta / count,
+        'd_mean_theta': dsum_theta / count,
+        'final_eci': eci,
+        'd_final_eci': deci,
+        'mean_eci': sum_eci / count,
+        'd_mean_eci': dsum_eci / count,
+    }
+
+
+def _normTangent(v, norm, dv):
+    # d|v| = v . dv / |v|, taken as 0 at v = 0
+    return np.einsum('nd,ndp->np', v, dv) / np.where(norm > 0, norm, np.inf)[:, None]
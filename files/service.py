@@ -0,0 +1,377 @@
+# service.py
+import argparse
+import asyncio
+import json
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from cache import SimulationCache, simulation_key
+from simulation import iter_simulation, run_simulation
+from trajectory import Trajectory
+from utils import make_rng
+
+# run_simulation arguments every job must give ('seed' is optional)
+JOB_PARAMS = ('T', 'M_0', 'theta_0', 'elite_data', 'eta', 'kappa', 'lambd', 'noise_scale', 'alpha', 'theta_star')
+
+# Trajectory columns streamed to clients
+COLUMNS = ('M', 'E', 'O', 'w', 'theta', 'eci')
+
+DEFAULT_PORT = 8765
+
+# Cycles per pool task; progress is published after each segment
+SEGMENT = 50
+
+
+def _run_segment(params, n, carry):
+    """
+    Worker: the next n cycles of a seeded run.
+
+    :param carry: None for the first segment, else the previous segment's carry
+    :return: (dict of (n, ...) row arrays, carry for the next segment)
+
+    The carry holds M, theta, the elite weights and the noise generator's state, so a run
+    cut into segments draws the same noise, in the same order, as one run_simulation call.
+    """
+    if carry is None:
+        M, theta, weights = params['M_0'], params['theta_0'], None
+        rng = make_rng(params.get('seed'))
+    else:
+        M, theta, weights = carry['M'], carry['theta'], carry['w']
+        rng = np.random.default_rng()
+        rng.bit_generator.state = carry['rng']
+
+    elite_data = params['elite_data']
+    if weights is not None:
+        elite_data = [dict(e, weight=w) for e, w in zip(elite_data, weights)]
+
+    rows = {name: [] for name in COLUMNS}
+    for state in iter_simulation(n, np.asarray(M, dtype=float), theta, elite_data, params['eta'], params['kappa'],
+                                 params['lambd'], params['noise_scale'], params['alpha'], params['theta_star'], rng=rng):
+        for name in COLUMNS:
+            rows[name].append(getattr(state, name))
+    rows = {name: np.array(values) for name, values in rows.items()}
+
+    carry = {'M': rows['M'][-1], 'theta': float(rows['theta'][-1]), 'w': rows['w'][-1], 'rng': rng.bit_generator.state}
+    return rows, carry
+
+
+def _run_whole(params):
+    # Worker: a noise-free run in one call (it takes the fast path and is usually short)
+    trajectory = run_simulation(*(params[name] for name in JOB_PARAMS))
+    return {name: getattr(trajectory, name) for name in COLUMNS}
+
+
+class Job:
+    def __init__(self, key, params):
+        """
+        One simulation being computed (or already finished) by the service.
+
+        Rows of `trajectory` are filled in as segments complete; `done` counts the cycles
+        available so far. Any number of clients may follow the same job with updates().
+        """
+        self.key = key
+        self.params = params
+        self.T = params['T']
+        self.trajectory = Trajectory(self.T, len(params['M_0']), len(params['elite_data']))
+        self.done = 0
+        self.finished = False
+        self.error = None
+        self.clients = 0
+        self.task = None
+        self._changed = asyncio.Condition()
+
+    def _store(self, start, rows):
+        stop = start + len(rows['theta'])
+        for name in COLUMNS:
+            getattr(self.trajectory, name)[start:stop] = rows[name]
+        return stop
+
+    async def _publish(self, done=None, error=None, finished=False):
+        async with self._changed:
+            if done is not None:
+                self.done = done
+            if finished:
+                self.finished = True
+                self.error = error
+            self._changed.notify_all()
+
+    async def updates(self):
+        """
+        Async iterator of (start, stop) row ranges as they become available, ending when the
+        job finishes; raises the job's error if it failed or was cancelled.
+        """
+        sent = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: self.done > sent or self.finished)
+                done, finished, error = self.done, self.finished, self.error
+            if done > sent:
+                yield sent, done
+                sent = done
+            if finished:
+                if error is not None:
+                    raise error
+                return
+
+    async def result(self):
+        async for _ in self.updates():
+            pass
+        return self.trajectory
+
+
+class SimulationService:
+    def __init__(self, workers=None, max_concurrent=4, segment=SEGMENT, cache=None):
+        """
+        Asyncio front end to a process pool of simulation workers.
+
+        Identical seeded jobs share one computation while in flight, and finished ones are
+        served from an LRU SimulationCache. At most max_concurrent jobs run at once; later
+        ones wait their turn. Runs are cut into segments of `segment` cycles, so progress
+        streams back and concurrent jobs interleave on the pool.
+
+        :param workers: process count (None lets the executor decide)
+        """
+        self.max_concurrent = max_concurrent
+        self.segment = segment
+        self.cache = SimulationCache() if cache is None else cache
+        self.deduplicated = 0
+        self.completed = 0
+        self._pool = ProcessPoolExecutor(max_workers=workers)
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._inflight = {}
+        self._running = 0
+
+    async def submit(self, params):
+        """
+        Start a job, or join the identical one already in flight.
+
+        :param params: dict of run_simulation arguments (JOB_PARAMS, optional 'seed');
+                       unseeded noisy jobs are never shared
+        :return: Job; call release(job) when no longer following it
+        """
+        missing = [name for name in JOB_PARAMS if name not in params]
+        if missing:
+            raise ValueError(f"job is missing {missing}")
+        params = dict(params, M_0=np.asarray(params['M_0'], dtype=float))
+        seed = params.get('seed')
+
+        key = None
+        if seed is not None or params['noise_scale'] == 0:
+            key = simulation_key(*(params[name] for name in JOB_PARAMS), seed)
+
+            job = self._inflight.get(key)
+            if job is not None:
+                self.deduplicated += 1
+                job.clients += 1
+                return job
+
+            cached = self.cache.get(key)
+            if cached is not None:
+                job = Job(key, params)
+                job.trajectory = cached
+                job.done = job.T
+                job.finished = True
+                job.clients += 1
+                return job
+
+        job = Job(key, params)
+        job.clients += 1
+        if key is not None:
+            self._inflight[key] = job
+        job.task = asyncio.create_task(self._runJob(job))
+        return job
+
+    def release(self, job):
+        """
+        Stop following a job; once no client follows it, an unfinished job is cancelled.
+        """
+        job.clients -= 1
+        if job.clients <= 0 and job.task is not None and not job.task.done():
+            job.task.cancel()
+
+    async def run(self, params):
+        # Submit, wait and release: the finished Trajectory
+        job = await self.submit(params)
+        try:
+            return await job.result()
+        finally:
+            self.release(job)
+
+    async def _runJob(self, job):
+        loop = asyncio.get_running_loop()
+        params = job.params
+        try:
+            async with self._slots:
+                self._running += 1
+                try:
+                    if params['noise_scale'] == 0:
+                        rows = await loop.run_in_executor(self._pool, _run_whole, params)
+                        await job._publish(job._store(0, rows))
+                    else:
+                        carry = None
+                        while job.done < job.T:
+                            n = min(self.segment, job.T - job.done)
+                            rows, carry = await loop.run_in_executor(self._pool, _run_segment, params, n, carry)
+                            await job._publish(job._store(job.done, rows))
+                finally:
+                    self._running -= 1
+
+            if job.key is not None:
+                self.cache.put(job.key, job.trajectory)
+            self.completed += 1
+            await job._publish(finished=True)
+        except asyncio.CancelledError:
+            await job._publish(error=RuntimeError("job cancelled"), finished=True)
+            raise
+        except Exception as exc:
+            await job._publish(error=exc, finished=True)
+        finally:
+            if job.key is not None and self._inflight.get(job.key) is job:
+                del self._inflight[job.key]
+
+    def stats(self):
+        return {
+            'inflight': len(self._inflight),
+            'running': self._running,
+            'max_concurrent': self.max_concurrent,
+            'completed': self.completed,
+            'deduplicated': self.deduplicated,
+            'cache_hits': self.cache.hits,
+            'cached': len(self.cache),
+        }
+
+    async def close(self):
+        for job in list(self._inflight.values()):
+            if job.task is not None:
+                job.task.cancel()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    # --- JSON-lines TCP front end ---
+
+    async def serve(self, host='127.0.0.1', port=DEFAULT_PORT):
+        """
+        Serve until cancelled. Each connection sends one JSON request line:
+          {"op": "run", "params": {...}, "rows": true}  ->  "accepted", then "progress" lines
+              (with the new rows unless rows is false), then "done" (or "error")
+          {"op": "stats"}  ->  one "stats" line
+        A client that disconnects releases its job.
+        """
+        server = await asyncio.start_server(self._handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader, writer):
+        async def send(message):
+            writer.write(json.dumps(message).encode() + b"\n")
+            await writer.drain()
+
+        try:
+            request = json.loads(await reader.readline())
+            if request.get('op') == 'stats':
+                await send({'event': 'stats', **self.stats()})
+                return
+            if request.get('op') != 'run':
+                raise ValueError(f"unknown op {request.get('op')!r}")
+
+            start_time = time.perf_counter()
+            job = await self.submit(request['params'])
+            try:
+                await send({'event': 'accepted', 'key': job.key, 'T': job.T, 'shared': job.clients > 1})
+                async for start, stop in job.updates():
+                    message = {'event': 'progress', 'start': start, 'stop': stop, 'T': job.T}
+                    if request.get('rows', True):
+                        message['rows'] = {name: getattr(job.trajectory, name)[start:stop].tolist() for name in COLUMNS}
+                    await send(message)
+                await send({'event': 'done', 'seconds': time.perf_counter() - start_time})
+            finally:
+                self.release(job)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as exc:
+            try:
+                await send({'event': 'error', 'message': f"{type(exc).__name__}: {exc}"})
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+
+class ServiceClient:
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, timeout=None):
+        """
+        Blocking client for SimulationService.serve (standard library only, usable from app.py).
+        """
+        self.address = (host, port)
+        self.timeout = timeout
+
+    @classmethod
+    def fromAddress(cls, address, timeout=None):
+        # "host:port" or just "port"
+        host, _, port = address.rpartition(":")
+        return cls(host or '127.0.0.1', int(port), timeout)
+
+    def _request(self, request):
+        sock = socket.create_connection(self.address, timeout=self.timeout)
+        with sock, sock.makefile('rb') as lines:
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            for line in lines:
+                message = json.loads(line)
+                if message['event'] == 'error':
+                    raise RuntimeError(f"simulation service: {message['message']}")
+                yield message
+
+    def run(self, params, on_progress=None):
+        """
+        Run a job on the service and return its Trajectory.
+
+        :param params: run_simulation arguments, as for SimulationService.submit
+        :param on_progress: optional callback(done, T) after each streamed segment
+        """
+        params = {k: (v.tolist() if isinstance(v, np.ndarray) else v) for k, v in params.items()}
+        trajectory = None
+        for message in self._request({'op': 'run', 'params': params}):
+            if message['event'] == 'accepted':
+                # The service has validated the job
+                trajectory = Trajectory(message['T'], len(params['M_0']), len(params['elite_data']))
+            elif message['event'] == 'progress':
+                start, stop = message['start'], message['stop']
+                for name in COLUMNS:
+                    getattr(trajectory, name)[start:stop] = message['rows'][name]
+                if on_progress is not None:
+                    on_progress(stop, message['T'])
+            elif message['event'] == 'done':
+                return trajectory
+        raise ConnectionError("simulation service closed the connection before the job finished")
+
+    def stats(self):
+        return next(self._request({'op': 'stats'}))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local simulation service shared by app sessions and scripts.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (None lets the executor decide)")
+    parser.add_argument("--max-concurrent", type=int, default=4, help="jobs computed at once; others queue")
+    parser.add_argument("--segment", type=int, default=SEGMENT, help="cycles per streamed segment")
+    args = parser.parse_args(argv)
+
+    async def serve():
+        service = SimulationService(args.workers, args.max_concurrent, args.segment)
+        print(f"simulation service on {args.host}:{args.port}")
+        try:
+            await service.serve(args.host, args.port)
+        finally:
+            await service.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
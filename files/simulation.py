@@ -1,15 +1,52 @@
 # simulation.py
+from collections import deque
+
 import numpy as np
 
-from elites import Elites
+from elites import Elites, SparseElites
+from fastpath import run_deterministic
 from dynamics import Dynamics
 from metrics import eliteCaptureIndex
-from state import State
-from utils import gaussian_noise
+from state import SparseVector, State
+from trajectory import Trajectory
+from utils import gaussian_noise, make_rng
+
+# Cycles of noise drawn at a time by iter_simulation
+NOISE_BLOCK = 1024
+
+def run_simulation(T, M_0, theta_0, elite_data, eta, kappa, lambd, noise_scale, alpha, theta_star, rng=None,
+                   profiler=None, elite_epsilon=None, elite_index=None, voters=None):
+    """
+    :param rng: seed or np.random.Generator for the noise; the same seed gives the same run
+    :param profiler: optional profiling.StageProfiler timing each of the seven stages
+    :param elite_epsilon: if set, track elites with SparseElites, dropping those whose weight
+                          falls below this value (for very large elite populations); the
+                          trajectory's w is then a trajectory.SparseWeights column
+    :param elite_index: optional spatial index for SparseElites (a spatial.build_index kind or a
+                        prebuilt index over the elite positions); requires elite_epsilon
+    :param voters: optional voters.VoterBlocs; M is then their aggregate, recomputed each cycle.
+                   M_0 is ignored, and each bloc's own eta (if set) and noise_scale replace the
+                   run's. The object is copied, so it can be reused across runs.
+
+    Noise-free runs (noise_scale == 0) go through fastpath.run_deterministic with tol=0: it stops
+    only at an exact fixed point, so the result is the same as the staged loop's. Call
+    run_deterministic directly to stop within a tolerance instead.
+    """
+    _checkEliteIndex(elite_epsilon, elite_index)
+
+    # Without noise the run is deterministic; take the fast path that stops at a fixed point
+    # (unless profiling, tracking a sparse active set or voter blocs, which need the staged loop)
+    if noise_scale == 0 and profiler is None and elite_epsilon is None and voters is None:
+        trajectory, _ = run_deterministic(T, M_0, theta_0, elite_data, eta, kappa, lambd, alpha, theta_star)
+        return trajectory
+
+    rng = make_rng(rng)
+    if voters is not None:
+        voters = voters.copy()
+        M_0 = voters.publicPreference()
 
-def run_simulation(T, M_0, theta_0, elite_data, eta, kappa, lambd, noise_scale, alpha, theta_star):
     # initialize elites
-    elites = Elites(elite_data)
+    elites = _makeElites(elite_data, len(M_0), elite_epsilon, elite_index)
 
     # initialize dynamics
     dynamics = Dynamics(
@@ -18,59 +55,195 @@ def run_simulation(T, M_0, theta_0, elite_data, eta, kappa, lambd, noise_scale,
         theta=theta_0
     )
 
-    states = []
-    
     # State tracking
-    M = np.array(M_0)
+    M = np.array(M_0, dtype=float)
     theta = theta_0
     
     d = len(M_0)
 
+    # Preallocated columns for the whole run
+    # M, E and O are written straight into their trajectory rows, so the loop does not allocate;
+    # sparse runs store only the active weights, so a cycle costs nothing per dropped elite
+    sparse = elite_epsilon is not None
+    trajectory = Trajectory(T, d, len(elites.weights), sparse=sparse)
+    workspace = np.empty(d)
+
+    # Draw all noise up front in one block, row t for cycle t
+    # (voter blocs draw (N_voters, d) standard normals per cycle instead)
+    if voters is None:
+        noise = gaussian_noise((T, d), noise_scale, rng)
+    else:
+        bloc_noise = np.empty_like(voters.positions)
+
     for t in range(T):
-        # 1. Compute Elite Centroid
-        # Uses the Elites class method which uses internal self.weights
-        E = elites.computeEliteCentroid()
-
-        # 2. Update Policy
-        O = dynamics.updatePolicy(
-            eliteInterest=E,
-            publicInterest=M,
-            theta=theta
+        if voters is not None:
+            noise_t = rng.standard_normal(out=bloc_noise)
+        else:
+            noise_t = noise[t]
+
+        # 1.-6. One political cycle
+        M, theta, eci = _cycle(
+            elites, dynamics, M, theta, noise_t, eta, kappa, lambd, alpha, theta_star,
+            E_out=trajectory.E[t], O_out=trajectory.O[t], M_out=trajectory.M[t], workspace=workspace,
+            profiler=profiler, voters=voters
         )
 
-        # 3. Compute Metrics
-        eci = eliteCaptureIndex(M, E, O)
+        # 7. Store State (M, E and O are already in place)
+        if sparse:
+            trajectory.w.setRow(t, elites.active, elites.activeWeights)
+        else:
+            trajectory.w[t] = elites.weights
+        trajectory.theta[t] = theta
+        trajectory.eci[t] = eci
+        if profiler is not None:
+            profiler.mark('store')
+
+    if profiler is not None:
+        profiler.stop()
+    return trajectory
+
+def iter_simulation(T, M_0, theta_0, elite_data, eta, kappa, lambd, noise_scale, alpha, theta_star,
+                    rng=None, stop=None, history=1, profiler=None, elite_epsilon=None, elite_index=None):
+    """
+    Generator variant of run_simulation: yields one State per cycle as soon as it is computed.
+
+    Only a window of the last `history` states is kept, so memory stays constant however
+    long the run. For the same rng the states match run_simulation row by row.
 
-        # 4. Update Public Preference
-        noise = gaussian_noise(d, noise_scale)
+    :param T: number of cycles, or None to run until a stop predicate fires
+    :param stop: predicate or list of predicates, called with the window (a deque, newest state last)
+                 after every cycle; the run ends once one returns True, after yielding that state
+    :param history: number of recent states kept in the window handed to the predicates
+    :param profiler: optional profiling.StageProfiler, as for run_simulation
+    :param elite_epsilon: optional SparseElites drop threshold, as for run_simulation; each state's
+                          w is then a state.SparseVector of the active weights
+    :param elite_index: optional SparseElites spatial index, as for run_simulation
+    """
+    if stop is None:
+        stop = []
+    elif callable(stop):
+        stop = [stop]
+
+    elites = _makeElites(elite_data, len(M_0), elite_epsilon, elite_index)
+    dynamics = Dynamics(policy=M_0, publicPreference=M_0, theta=theta_0)
+    rng = make_rng(rng)
+    sparse = elite_epsilon is not None
+
+    d = len(M_0)
+    M = np.array(M_0, dtype=float)
+    M_next = np.empty(d)
+    E = np.empty(d)
+    O = np.empty(d)
+    workspace = np.empty(d)
+    theta = theta_0
+    window = deque(maxlen=history)
+
+    t = 0
+    try:
+        while T is None or t < T:
+            # Noise comes in blocks; the values equal one up-front draw for the whole run
+            block = NOISE_BLOCK if T is None else min(NOISE_BLOCK, T - t)
+            noise = gaussian_noise((block, d), noise_scale, rng)
+
+            for row in noise:
+                M_next, theta, eci = _cycle(
+                    elites, dynamics, M, theta, row, eta, kappa, lambd, alpha, theta_star,
+                    E_out=E, O_out=O, M_out=M_next, workspace=workspace, profiler=profiler
+                )
+                M, M_next = M_next, M
+
+                # The yielded state owns its arrays; the loop buffers are reused next cycle
+                if sparse:
+                    w = SparseVector(len(elites.weights), elites.active.copy(), elites.activeWeights.copy())
+                else:
+                    w = elites.weights.copy()
+                state = State(M=M.copy(), E=E.copy(), O=O.copy(), w=w, theta=theta, t=t, eci=eci)
+                window.append(state)
+                if profiler is not None:
+                    profiler.mark('store')
+                yield state
+                t += 1
+
+                if any(predicate(window) for predicate in stop):
+                    return
+    finally:
+        if profiler is not None:
+            profiler.stop()
+
+def theta_below(threshold):
+    """
+    Stop predicate: democratic responsiveness has fallen below threshold
+    (below 0.3 the app's verdict is TOTAL OLIGARCHY).
+    """
+    return lambda window: window[-1].theta < threshold
+
+def _checkEliteIndex(elite_epsilon, elite_index):
+    if elite_index is not None and elite_epsilon is None:
+        raise ValueError("elite_index needs elite_epsilon (the index only serves SparseElites)")
+
+def _makeElites(elite_data, d, elite_epsilon, elite_index=None):
+    _checkEliteIndex(elite_epsilon, elite_index)
+    if elite_epsilon is None:
+        return Elites(elite_data, d=d)
+    return SparseElites(elite_data, d=d, epsilon=elite_epsilon, index=elite_index)
+
+def _cycle(elites, dynamics, M, theta, noise, eta, kappa, lambd, alpha, theta_star, E_out, O_out, M_out, workspace,
+           profiler=None, voters=None):
+    # Stages 1-6 of one political cycle; returns the new M and theta and this cycle's ECI
+    if profiler is not None:
+        profiler.start()
+
+    # 1. Compute Elite Centroid
+    # Uses the Elites class method which uses internal self.weights
+    E = elites.computeEliteCentroid(out=E_out)
+    if profiler is not None:
+        profiler.mark('centroid')
+
+    # 2. Update Policy
+    O = dynamics.updatePolicy(
+        eliteInterest=E,
+        publicInterest=M,
+        theta=theta,
+        out=O_out
+    )
+    if profiler is not None:
+        profiler.mark('policy')
+
+    # 3. Compute Metrics
+    eci = eliteCaptureIndex(M, E, O, workspace=workspace)
+    if profiler is not None:
+        profiler.mark('eci')
+
+    # 4. Update Public Preference
+    # (with voter blocs, every bloc moves and M is their aggregate)
+    if voters is not None:
+        M = voters.updatePreferences(O, eta, noise, out=M_out)
+        dynamics.publicPreference = M
+    else:
         M = dynamics.updatePublicPreference(
             originalPublicPref=M,
             policyOutcome=O,
             eta=eta,
-            noise=noise
+            noise=noise,
+            out=M_out
         )
+    if profiler is not None:
+        profiler.mark('public')
 
-        # 5. Update Elite Weights
-        # CRITICAL FIX: accessing .weights and .positions instead of .eliteInfluenceList
-        elites.updateWeights(
-            weights=elites.weights,
-            elitePoints=elites.positions,
-            outcome=O,
-            kappa=kappa
-        )
+    # 5. Update Elite Weights
+    # CRITICAL FIX: accessing .weights and .positions instead of .eliteInfluenceList
+    elites.updateWeights(
+        weights=elites.weights,
+        elitePoints=elites.positions,
+        outcome=O,
+        kappa=kappa
+    )
+    if profiler is not None:
+        profiler.mark('weights')
 
-        # 6. Update Responsiveness (Using new params: alpha, theta_star)
-        theta = dynamics.updateTheta(eci, lambd, alpha, theta_star)
-
-        # 7. Store State
-        state = State(
-            M=M,
-            E=E,
-            O=O,
-            w=elites.weights,
-            theta=theta,
-            t=t
-        )
-        states.append(state)
+    # 6. Update Responsiveness (Using new params: alpha, theta_star)
+    theta = dynamics.updateTheta(eci, lambd, alpha, theta_star)
+    if profiler is not None:
+        profiler.mark('theta')
 
-    return states
\ No newline at end of file
+    return M, theta, eci
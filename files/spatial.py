@@ -0,0 +1,176 @@
+# spatial.py
+import importlib.util
+
+import numpy as np
+
+# SciPy is optional; its KD-tree is used when installed, otherwise the grid below
+HAVE_SCIPY = importlib.util.find_spec("scipy") is not None
+
+# Average number of points per occupied grid cell aimed for when sizing cells
+POINTS_PER_CELL = 8
+
+
+class BruteIndex:
+    def __init__(self, positions):
+        """
+        Radius queries by checking every point; the reference the other indexes must agree with.
+        """
+        self.positions = np.ascontiguousarray(positions, dtype=float)
+        self.bounds = _bounds(self.positions)
+
+    def queryRadius(self, center, radius):
+        """
+        :return: sorted indices of the points within radius of center (inclusive)
+        """
+        distances = np.sqrt(np.sum((self.positions - center) ** 2, axis=1))
+        return np.flatnonzero(distances <= radius)
+
+    def nearest(self, center):
+        """
+        :return: index of the point closest to center (positions must be non-empty)
+        """
+        return int(np.argmin(np.sum((self.positions - center) ** 2, axis=1)))
+
+    def __len__(self):
+        return len(self.positions)
+
+
+class GridIndex:
+    def __init__(self, positions, cell=None):
+        """
+        Uniform grid over the points' bounding box; points are stored sorted by cell, so each
+        occupied cell is one contiguous slice. Meant for low dimensions (d <= 3).
+
+        :param cell: cell side length; by default chosen so an occupied cell holds about
+                     POINTS_PER_CELL points if the points were spread evenly
+        """
+        self.positions = np.ascontiguousarray(positions, dtype=float)
+        self.bounds = _bounds(self.positions)
+        K, d = self.positions.shape
+        self.origin = self.positions.min(axis=0) if K else np.zeros(d)
+
+        if cell is None:
+            extent = float((self.positions.max(axis=0) - self.origin).max()) if K else 0.0
+            cell = extent / max(K / POINTS_PER_CELL, 1.0) ** (1.0 / d) if extent > 0 else 1.0
+        self.cell = cell
+
+        coords = np.floor((self.positions - self.origin) / cell).astype(np.int64)
+        order = np.lexsort(coords.T[::-1]) if K else np.empty(0, dtype=np.int64)
+        coords = coords[order]
+
+        # One row per occupied cell, with the slice of `order` holding its points
+        change = np.ones(K, dtype=bool)
+        change[1:] = np.any(coords[1:] != coords[:-1], axis=1)
+        starts = np.flatnonzero(change)
+        self.order = order
+        self.cellCoords = coords[starts]
+        self.cellStarts = np.append(starts, K)
+        self.cells = {tuple(c): i for i, c in enumerate(self.cellCoords.tolist())}
+
+    def queryRadius(self, center, radius):
+        """
+        :return: sorted indices of the points within radius of center (inclusive)
+        """
+        lo = np.floor((center - radius - self.origin) / self.cell).astype(np.int64)
+        hi = np.floor((center + radius - self.origin) / self.cell).astype(np.int64)
+
+        # Walk the cells of the query box, or scan the occupied cells if that is fewer
+        span = hi - lo + 1
+        if np.prod(span.astype(float)) <= len(self.cellCoords):
+            ranges = np.stack(np.meshgrid(*[np.arange(a, b + 1) for a, b in zip(lo, hi)], indexing='ij'), -1)
+            hits = [self.cells[c] for c in map(tuple, ranges.reshape(-1, len(lo)).tolist()) if c in self.cells]
+        else:
+            inside = np.all((self.cellCoords >= lo) & (self.cellCoords <= hi), axis=1)
+            hits = np.flatnonzero(inside)
+
+        if len(hits) == 0:
+            return np.empty(0, dtype=np.int64)
+        candidates = np.concatenate([self.order[self.cellStarts[i]:self.cellStarts[i + 1]] for i in hits])
+        distances = np.sqrt(np.sum((self.positions[candidates] - center) ** 2, axis=1))
+        return np.sort(candidates[distances <= radius])
+
+    def nearest(self, center):
+        # Double the search radius until it holds a point; radius queries are exact,
+        # so the closest point found is the closest overall
+        radius = self.cell
+        found = self.queryRadius(center, radius)
+        while len(found) == 0:
+            radius *= 2
+            found = self.queryRadius(center, radius)
+        return int(found[np.argmin(np.sum((self.positions[found] - center) ** 2, axis=1))])
+
+    def __len__(self):
+        return len(self.positions)
+
+
+class KDTreeIndex:
+    def __init__(self, positions):
+        """
+        scipy.spatial.cKDTree wrapper with the same queryRadius interface (requires SciPy).
+        """
+        from scipy.spatial import cKDTree
+
+        self.positions = np.ascontiguousarray(positions, dtype=float)
+        self.bounds = _bounds(self.positions)
+        self.tree = cKDTree(self.positions)
+
+    def queryRadius(self, center, radius):
+        found = self.tree.query_ball_point(center, radius)
+        return np.sort(np.asarray(found, dtype=np.int64))
+
+    def nearest(self, center):
+        return int(self.tree.query(center)[1])
+
+    def __len__(self):
+        return len(self.positions)
+
+
+def _bounds(positions):
+    # (lowest, highest) coordinate per axis: the bounding box of the indexed points
+    if len(positions) == 0:
+        return np.zeros(positions.shape[1]), np.zeros(positions.shape[1])
+    return positions.min(axis=0), positions.max(axis=0)
+
+
+def build_index(positions, kind='auto'):
+    """
+    :param kind: 'kdtree', 'grid', 'brute', or 'auto' (KD-tree with SciPy, else a grid for
+                 d <= 3, else brute force)
+    """
+    positions = np.asarray(positions, dtype=float)
+    if kind == 'auto':
+        if HAVE_SCIPY:
+            kind = 'kdtree'
+        elif positions.shape[1] <= 3:
+            kind = 'grid'
+        else:
+            kind = 'brute'
+
+    if kind == 'kdtree':
+        if not HAVE_SCIPY:
+            raise ImportError("kind='kdtree' requires the scipy package")
+        return KDTreeIndex(positions)
+    if kind == 'grid':
+        return GridIndex(positions)
+    if kind == 'brute':
+        return BruteIndex(positions)
+    raise ValueError(f"Unknown index kind {kind!r}; choose 'auto', 'kdtree', 'grid' or 'brute'")
+
+
+def influence_radius(reference_distance, kappa, epsilon, weight_ratio=1.0):
+    """
+    Distance beyond which an elite's updated weight is certainly below epsilon.
+
+    One update maps w_k to w_k * exp(-kappa * d_k) / Z, where Z is the sum of those terms.
+    Take any elite r as reference and let w_max be the largest weight. If
+    d_k > d_r + (ln(w_max / w_r) + ln(1 / epsilon)) / kappa, then
+    w_k * exp(-kappa * d_k) <= w_max * exp(-kappa * d_k) < epsilon * w_r * exp(-kappa * d_r) <= epsilon * Z,
+    so the updated weight is below epsilon. Skipping such elites therefore drops nothing that
+    a full update would keep above epsilon.
+
+    :param reference_distance: d_r, distance from the outcome to the reference elite
+    :param weight_ratio: w_max / w_r (1 when the reference is the heaviest elite)
+    """
+    if kappa <= 0:
+        return np.inf
+    return reference_distance + (np.log(weight_ratio) + np.log(1.0 / epsilon)) / kappa
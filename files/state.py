@@ -2,7 +2,9 @@
 import numpy as np
 
 class State:
-    def __init__(self, M, E, O, w, theta, t):
+    __slots__ = ('M', 'E', 'O', 'w', 'theta', 't', 'eci')
+
+    def __init__(self, M, E, O, w, theta, t, eci=None):
         """
         Docstring for constructor
         
@@ -12,13 +14,18 @@ class State:
         :param w: List of elite weights, vector function of t 
         :param theta: Democratic responsiveness, or the public's weight in decision waiting
         :param t: timestamp (measured in political cycles)
+        :param eci: Elite Capture Index computed during cycle t
+
+        Arrays are not copied, so a State built from Trajectory rows is a view of that row.
+        w may also be a SparseVector (runs tracking elites sparsely); it is kept as is.
         """
-        self.M = np.array(M)
-        self.E = np.array(E)
-        self.O = np.array(O)
-        self.w = np.array(w)
+        self.M = np.asarray(M)
+        self.E = np.asarray(E)
+        self.O = np.asarray(O)
+        self.w = w if isinstance(w, SparseVector) else np.asarray(w)
         self.theta = theta
         self.t = t
+        self.eci = eci
     
     # accessor methods
     def getMedVoterPref(self):
@@ -35,3 +42,42 @@ class State:
 
     def getDemResponsv(self):
         return self.theta
+
+    def getEliteCaptureIndex(self):
+        return self.eci
+
+class SparseVector:
+    __slots__ = ('size', 'indices', 'values')
+
+    def __init__(self, size, indices, values):
+        """
+        Elite weights of one cycle as their nonzero entries, for elite populations tracked sparsely.
+
+        :param size: number of elites K
+        :param indices: elite indices of the stored entries
+        :param values: weights at those indices (every other weight is 0)
+
+        np.asarray(vector) gives the dense (K,) weights.
+        """
+        self.size = size
+        self.indices = indices
+        self.values = values
+
+    @property
+    def shape(self):
+        return (self.size,)
+
+    @property
+    def nbytes(self):
+        return self.indices.nbytes + self.values.nbytes
+
+    def toarray(self, dtype=float):
+        dense = np.zeros(self.size, dtype=dtype)
+        dense[self.indices] = self.values
+        return dense
+
+    def __array__(self, dtype=None, copy=None):
+        return self.toarray(float if dtype is None else dtype)
+
+    def __len__(self):
+        return self.size
@@ -0,0 +1,230 @@
+# sweep.py
+import argparse
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from ensemble import run_ensemble
+from metrics import BURN_IN
+from scenario import DEFAULTS, PARAMS as RUN_PARAMS, compile_elites
+
+# run_simulation arguments that a sweep may vary
+PARAM_NAMES = ('eta', 'kappa', 'lambd', 'alpha', 'theta_star', 'noise_scale')
+
+# Defaults for everything a sweep point does not set (scenario.DEFAULTS, elites compiled)
+DEFAULT_BASE = {
+    **{name: DEFAULTS[name] for name in RUN_PARAMS},
+    'elite_data': compile_elites(DEFAULTS['elites']),
+}
+
+
+def grid_design(axes):
+    """
+    Full factorial design.
+
+    :param axes: dict {param_name: sequence of values}
+    :return: list of dicts, one per grid point, last axis varying fastest
+    """
+    _check_names(axes)
+    names = list(axes)
+    return [dict(zip(names, map(float, values))) for values in itertools.product(*axes.values())]
+
+
+def latin_hypercube(bounds, n, seed=0):
+    """
+    Latin-hypercube design: each axis is cut into n strata and every stratum is hit once.
+
+    :param bounds: dict {param_name: (low, high)}
+    :param n: number of points
+    :param seed: seed for the stratum permutations and jitter
+    """
+    _check_names(bounds)
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for name, (low, high) in bounds.items():
+        u = (rng.permutation(n) + rng.random(n)) / n
+        columns[name] = low + u * (high - low)
+    return [{name: float(col[i]) for name, col in columns.items()} for i in range(n)]
+
+
+def point_seed(seed, index):
+    # Depends only on (seed, index), so results do not change with scheduling or resumes
+    return np.random.SeedSequence(seed, spawn_key=(index,))
+
+
+def run_point(index, point, base, seed, replicates):
+    """
+    Run all replicates of one sweep point as a single batched ensemble.
+
+    :return: dict record with the point, final theta, average theta and average ECI
+    """
+    params = dict(base, **point)
+    out = run_ensemble(
+        replicates, params['T'], np.asarray(params['M_0'], dtype=float), params['theta_0'],
+        params['elite_data'], params['eta'], params['kappa'], params['lambd'],
+        params['noise_scale'], params['alpha'], params['theta_star'],
+        seed=point_seed(seed, index)
+    )
+    burn_in = BURN_IN if params['T'] > BURN_IN else 0
+    return {
+        'index': index,
+        'point': point,
+        'final_theta': float(out['theta'][:, -1].mean()),
+        'avg_theta': float(out['theta'][:, burn_in:].mean()),
+        'avg_eci': float(out['eci'][:, burn_in:].mean()),
+    }
+
+
+def _run_chunk(chunk, base, seed, replicates):
+    return [run_point(index, point, base, seed, replicates) for index, point in chunk]
+
+
+def load_results(path):
+    """
+    Read the completed records of a sweep file, sorted by point index.
+    """
+    _, records = _read_records(path)
+    return sorted(records.values(), key=lambda r: r['index'])
+
+
+def sweep_settings(base, seed, replicates):
+    """
+    Everything besides the design that a sweep's records depend on, in canonical JSON form.
+
+    run_sweep writes it as the first line of the results file and only resumes a file whose
+    settings match.
+    """
+    settings = {'base': base, 'seed': seed, 'replicates': replicates, 'burn_in': BURN_IN}
+    return json.loads(json.dumps(settings, sort_keys=True, default=_jsonable))
+
+
+def run_sweep(points, out_path, base=None, seed=0, replicates=1, workers=None, chunksize=8):
+    """
+    Evaluate every design point on a process pool, appending one JSON line per point to out_path.
+
+    Points already present in out_path are skipped, so rerunning an interrupted sweep resumes it.
+    The file starts with a header holding sweep_settings; resuming with different settings
+    (T, seed, replicates, base parameters or elites) is refused rather than mixing results.
+
+    :param points: list of dicts from grid_design or latin_hypercube
+    :param base: run_simulation arguments shared by all points (defaults to DEFAULT_BASE)
+    :param seed: base seed; point i spawns its replicate streams from SeedSequence(seed, spawn_key=(i,))
+    :param replicates: noise replicates per point, run as one ensemble
+    :param workers: process count (None lets the executor decide)
+    :param chunksize: points per scheduled task
+    :return: all records, sorted by point index
+    :raises ValueError: if out_path was written by a different sweep
+    """
+    base = {**DEFAULT_BASE, **(base or {})}
+    settings = sweep_settings(base, seed, replicates)
+    header, done = _read_records(out_path)
+    if header is None and done:
+        raise ValueError(f"{out_path} has no sweep settings header; cannot tell what it was run with")
+    if header is not None and header != settings:
+        changed = sorted(k for k in settings.keys() | header.keys() if settings.get(k) != header.get(k))
+        raise ValueError(f"{out_path} was written by a sweep with different settings ({', '.join(changed)})")
+    for index, record in done.items():
+        if index >= len(points) or record['point'] != points[index]:
+            raise ValueError(f"{out_path} was written by a different sweep design (point {index})")
+
+    todo = [(i, p) for i, p in enumerate(points) if i not in done]
+    chunks = [todo[i:i + chunksize] for i in range(0, len(todo), chunksize)]
+
+    with open(out_path, 'a') as f, ProcessPoolExecutor(max_workers=workers) as pool:
+        if header is None:
+            f.write(json.dumps({'settings': settings}) + "\n")
+            f.flush()
+        futures = [pool.submit(_run_chunk, chunk, base, seed, replicates) for chunk in chunks]
+        for future in as_completed(futures):
+            for record in future.result():
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+
+    return load_results(out_path)
+
+
+def _check_names(params):
+    unknown = set(params) - set(PARAM_NAMES)
+    if unknown:
+        raise ValueError(f"Cannot sweep {sorted(unknown)}; choose from {PARAM_NAMES}")
+
+
+def _jsonable(value):
+    # numpy arrays and scalars in base (e.g. M_0 or elite positions)
+    return value.tolist()
+
+
+def _read_records(path):
+    # (settings header or None, {index: record})
+    if not os.path.exists(path):
+        return None, {}
+
+    with open(path, 'rb+') as f:
+        data = f.read()
+        # Drop a trailing line cut short by an interrupted write
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+
+    header = None
+    records = {}
+    for line in data[:end].splitlines():
+        if line.strip():
+            record = json.loads(line)
+            if 'settings' in record:
+                header = record['settings']
+            else:
+                records[record['index']] = record
+    return header, records
+
+
+def _parse_axis(spec):
+    # "eta=0.01:0.5:10" -> linspace, "eta=0.1,0.2" -> explicit values
+    name, values = spec.split("=", 1)
+    if ":" in values:
+        low, high, n = values.split(":")
+        return name, np.linspace(float(low), float(high), int(n))
+    return name, [float(v) for v in values.split(",")]
+
+
+def _parse_bounds(spec):
+    name, values = spec.split("=", 1)
+    low, high = values.split(":")
+    return name, (float(low), float(high))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parameter sweep over run_simulation arguments.")
+    parser.add_argument("--grid", action="append", default=[], metavar="NAME=LO:HI:N|V1,V2",
+                        help="grid axis; repeat for a full factorial design")
+    parser.add_argument("--lhs", action="append", default=[], metavar="NAME=LO:HI",
+                        help="Latin-hypercube bounds; repeat per parameter")
+    parser.add_argument("--samples", type=int, default=100, help="number of Latin-hypercube points")
+    parser.add_argument("--T", type=int, default=DEFAULT_BASE['T'], help="cycles per run")
+    parser.add_argument("--replicates", type=int, default=1, help="noise replicates per point")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunksize", type=int, default=8)
+    parser.add_argument("--out", required=True, help="JSON-lines results file (appended to and resumed)")
+    args = parser.parse_args(argv)
+
+    if bool(args.grid) == bool(args.lhs):
+        parser.error("give either --grid or --lhs axes")
+    if args.grid:
+        points = grid_design(dict(_parse_axis(s) for s in args.grid))
+    else:
+        points = latin_hypercube(dict(_parse_bounds(s) for s in args.lhs), args.samples, seed=args.seed)
+
+    try:
+        records = run_sweep(points, args.out, base={'T': args.T}, seed=args.seed,
+                            replicates=args.replicates, workers=args.workers, chunksize=args.chunksize)
+    except ValueError as exc:
+        parser.error(str(exc))
+    print(f"{len(records)} / {len(points)} points complete -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
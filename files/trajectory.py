@@ -0,0 +1,137 @@
+# trajectory.py
+import numpy as np
+
+from state import SparseVector, State
+
+class Trajectory:
+    # Names of the per-cycle column arrays
+    COLUMNS = ('M', 'E', 'O', 'w', 'theta', 'eci', 't')
+
+    def __init__(self, T, d, K, sparse=False):
+        """
+        Columnar store for a whole run, preallocated for T cycles.
+
+        :param T: number of political cycles
+        :param d: policy dimension
+        :param K: number of elites
+        :param sparse: store w as SparseWeights (only the nonzero weights of each cycle)
+        """
+        self.M = np.empty((T, d))
+        self.E = np.empty((T, d))
+        self.O = np.empty((T, d))
+        self.w = SparseWeights(T, K) if sparse else np.empty((T, K))
+        self.theta = np.empty(T)
+        self.eci = np.empty(T)
+        self.t = np.arange(T)
+
+    @classmethod
+    def fromColumns(cls, M, E, O, w, theta, eci, t):
+        """
+        Wrap existing column arrays without copying them.
+        """
+        traj = cls.__new__(cls)
+        traj.M = M
+        traj.E = E
+        traj.O = O
+        traj.w = w
+        traj.theta = theta
+        traj.eci = eci
+        traj.t = t
+        return traj
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.COLUMNS)
+
+    def setReadOnly(self):
+        # Freeze every column, e.g. before sharing the trajectory between callers
+        for name in self.COLUMNS:
+            getattr(self, name).setflags(write=False)
+        return self
+
+    def __len__(self):
+        return len(self.theta)
+
+    def __getitem__(self, key):
+        # Slices share memory with this trajectory; integers give a State view of one row
+        if isinstance(key, slice):
+            return Trajectory.fromColumns(
+                self.M[key], self.E[key], self.O[key], self.w[key], self.theta[key], self.eci[key], self.t[key]
+            )
+        return State(
+            M=self.M[key],
+            E=self.E[key],
+            O=self.O[key],
+            w=self.w[key],
+            theta=self.theta[key],
+            t=self.t[key],
+            eci=self.eci[key]
+        )
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+class SparseWeights:
+    def __init__(self, T, K, rows=None):
+        """
+        (T, K) weight column kept as one SparseVector per cycle, for runs with SparseElites.
+
+        Storing a cycle costs O(active elites) rather than O(K). Indexing a cycle gives its dense
+        (K,) weights, as for an ndarray column; row(t) gives the SparseVector itself, and
+        np.asarray(column) the dense (T, K) array.
+        """
+        self.K = K
+        self._rows = rows if rows is not None else [SparseVector(K, _NO_INDICES, _NO_VALUES)] * T
+        self._writeable = True
+
+    def setRow(self, t, indices, values):
+        # Copies the active indices and weights of cycle t
+        if not self._writeable:
+            raise ValueError("assignment destination is read-only")
+        self._rows[t] = SparseVector(self.K, np.array(indices), np.array(values, dtype=float))
+
+    def row(self, t):
+        return self._rows[t]
+
+    @property
+    def shape(self):
+        return (len(self._rows), self.K)
+
+    @property
+    def nbytes(self):
+        return sum(row.nbytes for row in self._rows)
+
+    def setflags(self, write):
+        self._writeable = write
+        for row in self._rows:
+            row.indices.setflags(write=write)
+            row.values.setflags(write=write)
+
+    def toarray(self, dtype=float):
+        dense = np.zeros(self.shape, dtype=dtype)
+        for t, row in enumerate(self._rows):
+            dense[t, row.indices] = row.values
+        return dense
+
+    def astype(self, dtype):
+        return self.toarray(dtype)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.toarray(float if dtype is None else dtype)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            sliced = SparseWeights(None, self.K, self._rows[key])
+            sliced._writeable = self._writeable
+            return sliced
+        return self._rows[key].toarray()
+
+# Stored entries of a row that was never written
+_NO_INDICES = np.empty(0, dtype=np.int64)
+_NO_VALUES = np.empty(0)
+_NO_INDICES.setflags(write=False)
+_NO_VALUES.setflags(write=False)
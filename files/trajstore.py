@@ -0,0 +1,201 @@
+# trajstore.py
+import json
+import struct
+
+import numpy as np
+
+from ensemble import run_ensemble
+from scenario import elite_records
+from trajectory import Trajectory
+from utils import spawn_rngs
+
+# File layout:
+#   MAGIC (8 bytes) | runs written (uint64) | header length (uint64) | JSON header | padding
+#   then one contiguous block per column, in COLUMNS order, each shaped (N, T, ...) in C order.
+MAGIC = b"OLIGTRJ1"
+_PREFIX = struct.Struct("<8sQQ")
+ALIGN = 64
+COLUMNS = ('M', 'E', 'O', 'w', 'theta', 'eci')
+
+
+def _columnShapes(N, T, d, K):
+    return {
+        'M': (N, T, d),
+        'E': (N, T, d),
+        'O': (N, T, d),
+        'w': (N, T, K),
+        'theta': (N, T),
+        'eci': (N, T),
+    }
+
+
+class TrajectoryWriter:
+    def __init__(self, path, N, T, d, K, params=None, elites=None, dtype='<f8'):
+        """
+        Create a trajectory file with room for N runs of T cycles, filled in streaming chunks of runs.
+
+        :param params: run_simulation arguments to record in the header (JSON-serializable)
+        :param elites: elite list as passed to run_simulation; names, positions and initial weights are recorded
+        :param dtype: storage dtype of every column, e.g. '<f4' to halve the file size
+        """
+        self.path = path
+        self.N = N
+        self.T = T
+        self.written = 0
+        self.dtype = np.dtype(dtype)
+        shapes = _columnShapes(N, T, d, K)
+
+        header = {
+            'version': 1,
+            'N': N, 'T': T, 'd': d, 'K': K,
+            'dtype': self.dtype.str,
+            'params': params or {},
+            'elites': [
+                {'name': name, 'position': position, 'weight': weight}
+                for name, position, weight in elite_records(elites or [])
+            ],
+            'columns': {},
+        }
+
+        # Column offsets depend on the header length, which depends on the offsets; pad generously
+        offset = 0
+        for name in COLUMNS:
+            header['columns'][name] = {'shape': list(shapes[name]), 'offset': offset}
+            offset += int(np.prod(shapes[name])) * self.dtype.itemsize
+        data_start = _alignUp(_PREFIX.size + len(json.dumps(header)) + 32 * len(COLUMNS))
+        for name in COLUMNS:
+            header['columns'][name]['offset'] += data_start
+        blob = json.dumps(header).encode()
+        if _PREFIX.size + len(blob) > data_start:
+            raise ValueError("trajectory header does not fit its reserved space")
+
+        self.columns = header['columns']
+        self._file = open(path, 'wb+')
+        self._file.write(_PREFIX.pack(MAGIC, 0, len(blob)))
+        self._file.write(blob)
+        self._file.truncate(data_start + offset)
+
+    def appendRuns(self, M, E, O, w, theta, eci):
+        """
+        Write the next chunk of runs; arrays are shaped like run_ensemble output, (n, T, ...).
+        """
+        n = len(theta)
+        if self.written + n > self.N:
+            raise ValueError(f"file holds {self.N} runs; cannot append {n} more after {self.written}")
+
+        chunk = {'M': M, 'E': E, 'O': O, 'w': w, 'theta': theta, 'eci': eci}
+        for name in COLUMNS:
+            spec = self.columns[name]
+            run_bytes = int(np.prod(spec['shape'][1:])) * self.dtype.itemsize
+            self._file.seek(spec['offset'] + self.written * run_bytes)
+            np.ascontiguousarray(chunk[name], dtype=self.dtype).tofile(self._file)
+
+        # Publish the new run count only after the data is down, so readers never see partial runs
+        self.written += n
+        self._file.flush()
+        self._file.seek(len(MAGIC))
+        self._file.write(struct.pack("<Q", self.written))
+        self._file.flush()
+
+    def appendEnsemble(self, out):
+        # Output dict of ensemble.run_ensemble
+        self.appendRuns(out['M'], out['E'], out['O'], out['w'], out['theta'], out['eci'])
+
+    def appendTrajectory(self, trajectory):
+        # A single run from simulation.run_simulation
+        self.appendRuns(*(np.asarray(getattr(trajectory, name))[None] for name in COLUMNS))
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TrajectoryFile:
+    def __init__(self, path):
+        """
+        Lazy, read-only view of a trajectory file. Columns are np.memmap arrays shaped (runs, T, ...),
+        so slicing a run or a cycle only touches the pages it needs.
+        """
+        with open(path, 'rb') as f:
+            magic, written, header_len = _PREFIX.unpack(f.read(_PREFIX.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a trajectory file")
+            header = json.loads(f.read(header_len))
+
+        self.path = path
+        self.header = header
+        self.params = header['params']
+        self.elites = header['elites']
+        self.names = [e['name'] for e in self.elites]
+        self.N = written
+        self.T = header['T']
+
+        dtype = np.dtype(header['dtype'])
+        for name in COLUMNS:
+            spec = header['columns'][name]
+            shape = tuple(spec['shape'])
+            if written == 0:
+                column = np.empty((0,) + shape[1:], dtype=dtype)
+            else:
+                # Only the runs published so far are mapped
+                column = np.memmap(path, dtype=dtype, mode='r', offset=spec['offset'], shape=(written,) + shape[1:])
+            setattr(self, name, column)
+
+    def __len__(self):
+        return self.N
+
+    def run(self, i):
+        """
+        Run i as a Trajectory whose columns are views into the file.
+        """
+        return Trajectory.fromColumns(self.M[i], self.E[i], self.O[i], self.w[i], self.theta[i], self.eci[i], np.arange(self.T))
+
+    def cycle(self, t):
+        """
+        Cycle t across all runs: dict of (runs, ...) strided views.
+        """
+        return {name: getattr(self, name)[:, t] for name in COLUMNS}
+
+    def eliteList(self):
+        # Elites in the app's {'name', 'x', 'y', 'weight'} form (first two policy axes)
+        return [
+            {'name': e['name'], 'x': e['position'][0], 'y': e['position'][1], 'weight': e['weight']}
+            for e in self.elites
+        ]
+
+
+def open_trajectories(path):
+    return TrajectoryFile(path)
+
+
+def write_ensemble(path, N, T, M_0, theta_0, elite_data, eta, kappa, lambd, noise_scale, alpha, theta_star,
+                   seed=None, chunk=1024, dtype='<f8'):
+    """
+    Run an N-run ensemble in chunks of runs and stream each chunk to a trajectory file,
+    so only one chunk is ever held in memory. Run i uses the same stream as run_ensemble(N, ..., seed=seed).
+    """
+    M_0 = np.asarray(M_0, dtype=float)
+    params = {
+        'T': T, 'M_0': M_0.tolist(), 'theta_0': theta_0, 'eta': eta, 'kappa': kappa, 'lambd': lambd,
+        'noise_scale': noise_scale, 'alpha': alpha, 'theta_star': theta_star, 'seed': seed,
+    }
+    # Spawning chunk by chunk from one SeedSequence gives the same children as spawning all N at once
+    seed_seq = np.random.SeedSequence(seed)
+
+    with TrajectoryWriter(path, N, T, M_0.shape[-1], len(elite_data), params, elite_data, dtype) as writer:
+        for start in range(0, N, chunk):
+            stop = min(start + chunk, N)
+            writer.appendEnsemble(run_ensemble(
+                stop - start, T, M_0, theta_0, elite_data, eta, kappa, lambd, noise_scale, alpha, theta_star,
+                rngs=spawn_rngs(seed_seq, stop - start)
+            ))
+    return open_trajectories(path)
+
+
+def _alignUp(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
@@ -1,5 +1,29 @@
 # utils.py
 import numpy as np
 
-def gaussian_noise(d, scale):
-    return np.random.normal(0, scale, size=d)
+def make_rng(seed=None):
+    """
+    :param seed: None, an int, a SeedSequence or a Generator (returned unchanged)
+    :return: np.random.Generator; None draws fresh OS entropy
+    """
+    if isinstance(seed, np.random.Generator):
+        return seed
+    return np.random.default_rng(seed)
+
+def spawn_rngs(seed, n):
+    """
+    Independent child streams for batch or parallel runs, via SeedSequence.spawn.
+
+    :param seed: None, an int or a SeedSequence
+    :param n: number of streams
+    """
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return [np.random.default_rng(child) for child in seed.spawn(n)]
+
+def gaussian_noise(d, scale, rng=None):
+    """
+    :param d: output shape; an int for one cycle or (T, d) for a whole run
+    :param rng: seed or Generator, see make_rng
+    """
+    return make_rng(rng).normal(0, scale, size=d)
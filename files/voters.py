@@ -0,0 +1,127 @@
+# voters.py
+import numpy as np
+
+AGGREGATES = ('mean', 'median')
+
+
+class VoterBlocs:
+    def __init__(self, positions, weights=None, eta=None, noise_scale=0.0, aggregate='mean'):
+        """
+        A heterogeneous public: N voter blocs, each with its own preference, size, learning
+        rate and noise level. The public preference M is their weighted mean, or their
+        coordinate-wise weighted median, recomputed every cycle.
+
+        :param positions: (N, d) initial bloc preferences
+        :param weights: (N,) bloc sizes (default: equal)
+        :param eta: per-bloc learning rates, (N,) or a scalar (default: use the run's eta)
+        :param noise_scale: per-bloc noise standard deviations, (N,) or a scalar
+        :param aggregate: 'mean' or 'median'
+        """
+        self.positions = np.array(positions, dtype=float)
+        if self.positions.ndim != 2 or len(self.positions) == 0:
+            raise ValueError("positions must have shape (N, d) with N >= 1")
+        N = len(self.positions)
+
+        self.weights = np.ones(N) if weights is None else np.array(weights, dtype=float)
+        self.eta = None if eta is None else np.broadcast_to(np.asarray(eta, dtype=float), (N,)).copy()
+        self.noise_scale = np.broadcast_to(np.asarray(noise_scale, dtype=float), (N,)).copy()
+        if len(self.weights) != N:
+            raise ValueError("need exactly one weight per voter bloc")
+        if np.any(self.weights < 0) or not np.sum(self.weights) > 0:
+            raise ValueError("bloc weights must be non-negative with a positive total")
+        if aggregate not in AGGREGATES:
+            raise ValueError(f"Unknown aggregate {aggregate!r}; choose from {AGGREGATES}")
+        self.aggregate = aggregate
+        self.d = self.positions.shape[1]
+
+        # Scratch buffer, and the streaming-median state per axis: last median and search half-width
+        self._diff = np.empty_like(self.positions)
+        self._median = None
+        self._band = None
+
+    @classmethod
+    def fromList(cls, bloc_list, aggregate='mean'):
+        """
+        :param bloc_list: list of dicts [{'x', 'y' (or 'position'), 'weight', 'eta', 'noise'}, ...];
+                          'weight', 'eta' and 'noise' are optional
+        """
+        positions = [b['position'] if 'position' in b else [b['x'], b['y']] for b in bloc_list]
+        weights = [b.get('weight', 1.0) for b in bloc_list]
+        eta = [b['eta'] for b in bloc_list] if all('eta' in b for b in bloc_list) else None
+        noise = [b.get('noise', 0.0) for b in bloc_list]
+        return cls(positions, weights, eta, noise, aggregate)
+
+    def copy(self):
+        blocs = VoterBlocs.__new__(VoterBlocs)
+        blocs.__dict__.update({k: (v.copy() if isinstance(v, np.ndarray) else v) for k, v in self.__dict__.items()})
+        return blocs
+
+    def __len__(self):
+        return len(self.positions)
+
+    def publicPreference(self, out=None):
+        """
+        Current M: weighted mean or coordinate-wise weighted median of the bloc preferences.
+        """
+        if out is None:
+            out = np.empty(self.d)
+
+        if self.aggregate == 'mean':
+            np.dot(self.weights, self.positions, out=out)
+            out /= np.sum(self.weights)
+            return out
+
+        if self._median is None:
+            self._median = np.median(self.positions, axis=0)
+            self._band = np.std(self.positions, axis=0) / np.sqrt(len(self)) + 1e-12
+
+        half = 0.5 * np.sum(self.weights)
+        for j in range(self.d):
+            out[j] = self._weightedMedian(j, half)
+        return out
+
+    def _weightedMedian(self, j, half):
+        # Lower weighted median of axis j: the first value, in sorted order, at which the
+        # cumulative weight reaches half the total.
+        # Streaming: the median moves little per cycle, so only blocs within a band around the
+        # last one are sorted; the band doubles until it brackets the median, then adapts.
+        x = self.positions[:, j]
+        last = self._median[j]
+        delta = self._band[j]
+        while True:
+            low, high = last - delta, last + delta
+            below = np.sum(self.weights, where=x < low)
+            inside = (x >= low) & (x <= high)
+            if below < half <= below + np.sum(self.weights, where=inside):
+                break
+            if not np.isfinite(delta):
+                raise FloatingPointError("voter bloc preferences are not finite")
+            delta *= 2
+
+        candidates = np.flatnonzero(inside)
+        candidates = candidates[np.argsort(x[candidates], kind='stable')]
+        k = np.searchsorted(below + np.cumsum(self.weights[candidates]), half)
+        median = x[candidates[min(k, len(candidates) - 1)]]
+
+        self._median[j] = median
+        self._band[j] = max(0.5 * delta, 2.0 * abs(median - last), 1e-12 * (1.0 + abs(median)))
+        return median
+
+    def updatePreferences(self, policyOutcome, eta, noise, out=None):
+        """
+        Move every bloc toward the policy at its own rate, add its own noise, and return the new M.
+
+        :param eta: learning rate for blocs without their own
+        :param noise: (N, d) standard-normal draws, scaled here by each bloc's noise_scale (overwritten)
+        :param out: optional buffer for the new M
+        """
+        rates = eta if self.eta is None else self.eta[:, None]
+
+        # p += eta_i * (O - p) + sigma_i * z
+        np.subtract(policyOutcome, self.positions, out=self._diff)
+        self._diff *= rates
+        self.positions += self._diff
+        noise *= self.noise_scale[:, None]
+        self.positions += noise
+
+        return self.publicPreference(out=out)